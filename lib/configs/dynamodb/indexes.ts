@@ -0,0 +1,10 @@
+// Secondary indexes created by a deploy of their own. CloudFormation creates
+// one GSI per table update, and a new GSI is backfilled from the items
+// already holding its key. Set to 'true' once the previous deploy is done.
+
+// SchoolTermIndex of waseda-syllabus, after school_term has been written to
+// every course, see backfill_syllabus of update-syllabus
+export const SYLLABUS_TERM_INDEX = process.env.SYLLABUS_TERM_INDEX === 'true';
+
+// TagIndex of forum-threads, after the deploy creating GroupIndex
+export const THREAD_TAG_INDEX = process.env.THREAD_TAG_INDEX === 'true';
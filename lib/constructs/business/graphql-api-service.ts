@@ -2,6 +2,7 @@ import * as appsync from '@aws-cdk/aws-appsync-alpha';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import { Construct } from 'constructs';
 
+import { SYLLABUS_TERM_INDEX } from '../../configs/dynamodb/indexes';
 import {
   generateConnectionAndEdge,
   int,
@@ -117,13 +118,18 @@ export class CourseApiService extends GraphqlApiService {
       returnType: CourseConnection.attribute(),
       dataSource: dataSource,
       args: {
+        school: required(School),
         form: required(FilterForm),
         after: string,
         first: int,
         before: string,
         last: int,
       },
-      requestMappingTemplate: appsync.MappingTemplate.fromFile('src/appsync/mapping/syllabus-filter-req.vtl'),
+      // semester queries read SchoolTermIndex only once it is created
+      requestMappingTemplate: appsync.MappingTemplate.fromString(
+        `#set($useTermIndex = ${SYLLABUS_TERM_INDEX})\n` +
+          appsync.MappingTemplate.fromFile('src/appsync/mapping/syllabus-filter-req.vtl').renderTemplate(),
+      ),
       responseMappingTemplate: appsync.MappingTemplate.dynamoDbResultList(),
     }));
   }
@@ -25,6 +25,7 @@ import {
   userProfilePatchReqSchema,
 } from '../../configs/api-gateway/schema';
 import { AwsServicePrincipal } from '../../configs/common/aws';
+import { THREAD_TAG_INDEX } from '../../configs/dynamodb/indexes';
 import {
   CourseReviewsFunctions,
   SyllabusFunctions,
@@ -187,7 +188,16 @@ export class SyllabusApiService extends RestApiService {
         ],
       },
     });
-    const syllabusFunctions = new SyllabusFunctions(this, 'syllabus-function');
+    const syllabusFunctions = new SyllabusFunctions(
+      this,
+      'syllabus-function',
+      {
+        envVars: {
+          ['BUCKET_NAME']: props.dataSource!,
+          ['OBJECT_PATH']: 'course/',
+        },
+      },
+    );
     const courseGetIntegration = new apigw.LambdaIntegration(
       syllabusFunctions.getFunction,
       { proxy: true },
@@ -835,6 +845,9 @@ export class ForumThreadsApiService extends RestApiService {
         envVars: {
           TABLE_NAME: props.dataSource!,
           BUCKET_NAME: 'wasedatime-thread-img',
+          FEED_TABLE_NAME: 'forum-thread-feeds',
+          LIKE_TABLE_NAME: 'forum-thread-likes',
+          TAG_INDEX: String(THREAD_TAG_INDEX),
         },
       },
     );
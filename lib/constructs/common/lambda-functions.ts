@@ -136,6 +136,17 @@ export class SyllabusScraper extends Construct {
   constructor(scope: Construct, id: string, props: FunctionsProps) {
     super(scope, id);
 
+    const syllabusLayer = new lambda_py.PythonLayerVersion(
+      this,
+      'SyllabusPythonLayerVersion',
+      {
+        entry: 'src/layer/syllabus',
+        compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+        layerVersionName: 'syllabus-python-layer',
+        description: 'Layer containing the shared syllabus parser and course record',
+      },
+    );
+
     const s3AccessRole: iam.LazyRole = new iam.LazyRole(
       this,
       's3-access-role',
@@ -170,6 +181,7 @@ export class SyllabusScraper extends Construct {
       timeout: Duration.seconds(300),
       environment: props.envVars,
       role: s3AccessRole,
+      layers: [syllabusLayer],
     });
   }
 }
@@ -364,9 +376,20 @@ export class SyllabusFunctions extends Construct {
   readonly getFunction: lambda.Function;
   readonly postFunction: lambda.Function;
 
-  constructor(scope: Construct, id: string, props?: FunctionsProps) {
+  constructor(scope: Construct, id: string, props: FunctionsProps) {
     super(scope, id);
 
+    const syllabusLayer = new lambda_py.PythonLayerVersion(
+      this,
+      'SyllabusPythonLayerVersion',
+      {
+        entry: 'src/layer/syllabus',
+        compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+        layerVersionName: 'syllabus-python-layer',
+        description: 'Layer containing the shared syllabus parser and course record',
+      },
+    );
+
     const dynamoDBReadRole: iam.LazyRole = new iam.LazyRole(
       this,
       'dynamo-read-role',
@@ -391,14 +414,52 @@ export class SyllabusFunctions extends Construct {
       },
     );
 
+    const courseCacheRole: iam.LazyRole = new iam.LazyRole(
+      this,
+      'course-cache-role',
+      {
+        assumedBy: new iam.ServicePrincipal(AwsServicePrincipal.LAMBDA),
+        description: 'Allow lambda function to cache course info in s3',
+        path: `/service-role/${AwsServicePrincipal.LAMBDA}/`,
+        roleName: 'lambda-course-cache-access',
+        managedPolicies: [
+          iam.ManagedPolicy.fromManagedPolicyArn(
+            this,
+            'basic-exec2',
+            'arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole',
+          ),
+        ],
+      },
+    );
+    courseCacheRole.addToPolicy(
+      new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: ['s3:GetObject', 's3:PutObject'],
+        resources: [
+          `arn:aws:s3:::${props.envVars['BUCKET_NAME']}/${props.envVars['OBJECT_PATH']}*`,
+        ],
+      }),
+    );
+    // without list permission a missing object is reported as AccessDenied instead of NoSuchKey
+    courseCacheRole.addToPolicy(
+      new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: ['s3:ListBucket'],
+        resources: [`arn:aws:s3:::${props.envVars['BUCKET_NAME']}`],
+      }),
+    );
+
     this.getFunction = new lambda_py.PythonFunction(this, 'get-course', {
       entry: 'src/lambda/get-course',
       description: 'Get course info from Waseda.',
       functionName: 'get-course',
       logRetention: logs.RetentionDays.ONE_MONTH,
       memorySize: 256,
+      role: courseCacheRole,
       runtime: lambda.Runtime.PYTHON_3_9,
       timeout: Duration.seconds(3),
+      environment: props.envVars,
+      layers: [syllabusLayer],
     });
 
     const comprehendFullAccessRole: iam.LazyRole = new iam.LazyRole(
@@ -443,6 +504,17 @@ export class SyllabusUpdateFunction extends Construct {
   constructor(scope: Construct, id: string, props: FunctionsProps) {
     super(scope, id);
 
+    const syllabusLayer = new lambda_py.PythonLayerVersion(
+      this,
+      'SyllabusPythonLayerVersion',
+      {
+        entry: 'src/layer/syllabus',
+        compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+        layerVersionName: 'syllabus-python-layer',
+        description: 'Layer containing the shared syllabus parser and course record',
+      },
+    );
+
     const LambdaFullAccess = new iam.LazyRole(this, 'lambda-fullaccess-role', {
       assumedBy: new iam.ServicePrincipal(AwsServicePrincipal.LAMBDA),
       description: 'Allow lambda function to access s3 buckets and dynamodb',
@@ -480,6 +552,7 @@ export class SyllabusUpdateFunction extends Construct {
         runtime: lambda.Runtime.PYTHON_3_9,
         timeout: Duration.seconds(60),
         environment: props.envVars,
+        layers: [syllabusLayer],
       },
     );
   }
@@ -1082,6 +1155,55 @@ export class CareerDBSyncFunction extends Construct {
   }
 }
 
+export class ForumFeedSyncFunction extends Construct {
+  readonly syncFeedFunction: lambda.Function;
+
+  constructor(scope: Construct, id: string, props: FunctionsProps) {
+    super(scope, id);
+
+    const DBSyncRole: iam.LazyRole = new iam.LazyRole(
+      this,
+      'dynamodb-thread-feed-sync-role',
+      {
+        assumedBy: new iam.ServicePrincipal(AwsServicePrincipal.LAMBDA),
+        description:
+          'Allow lambda function to read thread stream and write thread feeds',
+        path: `/service-role/${AwsServicePrincipal.LAMBDA}/`,
+        roleName: 'dynamodb-thread-feed-sync-role',
+        managedPolicies: [
+          iam.ManagedPolicy.fromManagedPolicyArn(
+            this,
+            'basic-exec1',
+            'arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole',
+          ),
+          iam.ManagedPolicy.fromManagedPolicyArn(
+            this,
+            'db-full-access',
+            'arn:aws:iam::aws:policy/AmazonDynamoDBFullAccess',
+          ),
+        ],
+      },
+    );
+
+    this.syncFeedFunction = new lambda_py.PythonFunction(
+      this,
+      'sync-thread-feed',
+      {
+        entry: 'src/lambda/sync-thread-feed',
+        description:
+          'Keep the latest threads of each board and univ in the feed table',
+        functionName: 'sync-thread-feed',
+        logRetention: logs.RetentionDays.ONE_MONTH,
+        memorySize: 256,
+        role: DBSyncRole,
+        runtime: lambda.Runtime.PYTHON_3_9,
+        timeout: Duration.seconds(30),
+        environment: props.envVars,
+      },
+    );
+  }
+}
+
 export class CareerRestFunctions extends Construct {
   readonly getFunction: lambda.Function;
   readonly postFunction: lambda.Function;
@@ -1185,6 +1307,17 @@ export class ForumThreadAIFunctions extends Construct {
       },
     );
 
+    const syllabusLayer = new lambda_py.PythonLayerVersion(
+      this,
+      'SyllabusPythonLayerVersion',
+      {
+        entry: 'src/layer/syllabus',
+        compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+        layerVersionName: 'syllabus-python-layer',
+        description: 'Layer containing the shared syllabus parser and course record',
+      },
+    );
+
     const bedrockAccessPolicy = new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
       actions: ['bedrock:InvokeModel'],
@@ -1231,7 +1364,7 @@ export class ForumThreadAIFunctions extends Construct {
       runtime: lambda.Runtime.PYTHON_3_9,
       timeout: Duration.seconds(60),
       environment: props.envVars,
-      layers: [latestBoto3Layer],
+      layers: [latestBoto3Layer, syllabusLayer],
     });
   }
 }
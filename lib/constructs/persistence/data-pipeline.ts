@@ -1,4 +1,4 @@
-import { RemovalPolicy } from 'aws-cdk-lib';
+import { Duration, RemovalPolicy } from 'aws-cdk-lib';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as events from 'aws-cdk-lib/aws-events';
 import * as events_targets from 'aws-cdk-lib/aws-events-targets';
@@ -9,6 +9,7 @@ import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as sfn from 'aws-cdk-lib/aws-stepfunctions';
 import * as sfn_tasks from 'aws-cdk-lib/aws-stepfunctions-tasks';
 import { Construct } from 'constructs';
+import { SYLLABUS_TERM_INDEX } from '../../configs/dynamodb/indexes';
 import { syllabusSchedule } from '../../configs/event/schedule';
 import { prodCorsRule } from '../../configs/s3/cors';
 import { allowApiGatewayPolicy, allowLambdaPolicy } from '../../utils/s3';
@@ -20,6 +21,7 @@ import {
   CareerDBSyncFunction,
   ForumThreadAIFunctions,
   ForumCommentAIFunctions,
+  ForumFeedSyncFunction,
 } from '../common/lambda-functions';
 
 export enum Worker {
@@ -30,6 +32,7 @@ export enum Worker {
   ADS,
   FORUMAI,
   COMMENTAI,
+  FORUMFEED,
 }
 
 export interface DataPipelineProps {
@@ -45,6 +48,49 @@ export abstract class AbstractDataPipeline extends Construct {
   abstract readonly dataWarehouse?: s3.Bucket | dynamodb.Table;
 }
 
+// schools scraped by the state machine, G_WOSPM is left out on purpose
+const syllabusSchools = [
+  'GEC',
+  'CMS',
+  'HSS',
+  'EDU',
+  'FSE',
+  'ASE',
+  'CSE',
+  'PSE',
+  'G_ASE',
+  'LAW',
+  'G_FSE',
+  'SOC',
+  'SSS',
+  'G_LAS',
+  'G_CSE',
+  'G_EDU',
+  'HUM',
+  'SILS',
+  'G_HUM',
+  'CJL',
+  'SPS',
+  'G_WBS',
+  'G_PS',
+  'G_SPS',
+  'G_IPS',
+  'G_WLS',
+  'G_E',
+  'G_SSS',
+  'G_SC',
+  'G_LAW',
+  'G_SAPS',
+  'G_SA',
+  'G_SJAL',
+  'G_SICCS',
+  'G_SEEE',
+  'EHUM',
+  'ART',
+  'CIE',
+  'G_ITS',
+];
+
 export class SyllabusDataPipeline extends AbstractDataPipeline {
   readonly dataSource?: s3.Bucket;
   readonly processor: sfn.StateMachine;
@@ -63,6 +109,15 @@ export class SyllabusDataPipeline extends AbstractDataPipeline {
       publicReadAccess: false,
       removalPolicy: RemovalPolicy.RETAIN,
       versioned: true,
+      lifecycleRules: [
+        {
+          // courses cached by get-course are rewritten every day, their
+          // old versions are never read
+          id: 'expire-course-cache-versions',
+          prefix: 'course/',
+          noncurrentVersionExpiration: Duration.days(1),
+        },
+      ],
     });
     allowApiGatewayPolicy(this.dataWarehouse);
     allowLambdaPolicy(this.dataWarehouse);
@@ -78,58 +133,56 @@ export class SyllabusDataPipeline extends AbstractDataPipeline {
       },
     ).baseFunction;
 
-    function getLambdaTaskInstance(
-      schools: string[],
-      num: string,
-    ): sfn_tasks.LambdaInvoke {
-      return new sfn_tasks.LambdaInvoke(scope, 'task-' + num, {
-        lambdaFunction: scraperBaseFunction,
-        comment: 'Scrape the syllabus info of school(s).',
-        invocationType: sfn_tasks.LambdaInvocationType.REQUEST_RESPONSE,
-        payload: sfn.TaskInput.fromObject({ schools: schools }),
-        qualifier: scraperBaseFunction.latestVersion.version,
-      });
-    }
+    const planTask = new sfn_tasks.LambdaInvoke(scope, 'task-plan', {
+      lambdaFunction: scraperBaseFunction,
+      comment:
+        'Count the catalog pages of every school and balance them into batches',
+      invocationType: sfn_tasks.LambdaInvocationType.REQUEST_RESPONSE,
+      payload: sfn.TaskInput.fromObject({
+        task: 'plan',
+        schools: syllabusSchools,
+      }),
+      qualifier: scraperBaseFunction.latestVersion.version,
+      outputPath: '$.Payload',
+    });
+
+    // batches run in parallel and share the workers of a single scraper, so
+    // the syllabus site sees no more requests in flight than before the fan-out
+    const scrapeConcurrency = 4;
+    const scrapeWorkers = 32;
+
+    const scrapeTask = new sfn_tasks.LambdaInvoke(scope, 'task-scrape', {
+      lambdaFunction: scraperBaseFunction,
+      comment: 'Scrape the syllabus info of school(s).',
+      invocationType: sfn_tasks.LambdaInvocationType.REQUEST_RESPONSE,
+      payload: sfn.TaskInput.fromObject({
+        schools: sfn.JsonPath.listAt('$.schools'),
+        worker: scrapeWorkers / scrapeConcurrency,
+      }),
+      qualifier: scraperBaseFunction.latestVersion.version,
+    });
+
+    const scrapeBatches = new sfn.Map(this, 'scrape-batches', {
+      comment: 'Scrape the planned batches of schools.',
+      itemsPath: sfn.JsonPath.stringAt('$.batches'),
+      maxConcurrency: scrapeConcurrency,
+      resultPath: sfn.JsonPath.DISCARD,
+    }).iterator(scrapeTask);
+
+    const indexTask = new sfn_tasks.LambdaInvoke(scope, 'task-index', {
+      lambdaFunction: scraperBaseFunction,
+      comment: 'Merge the syllabus of all schools into the search index.',
+      invocationType: sfn_tasks.LambdaInvocationType.REQUEST_RESPONSE,
+      payload: sfn.TaskInput.fromObject({ task: 'index' }),
+      qualifier: scraperBaseFunction.latestVersion.version,
+    });
 
     // todo sync to table
     this.processor = new sfn.StateMachine(this, 'state-machine', {
       stateMachineName: 'syllabus-scraper',
-      definition: getLambdaTaskInstance(['GEC'], '0')
-        .next(getLambdaTaskInstance(['CMS', 'HSS'], '1'))
-        .next(getLambdaTaskInstance(['EDU', 'FSE'], '2'))
-        .next(getLambdaTaskInstance(['ASE', 'CSE'], '3'))
-        .next(getLambdaTaskInstance(['PSE', 'G_ASE', 'LAW'], '4'))
-        .next(getLambdaTaskInstance(['G_FSE', 'SOC', 'SSS'], '5'))
-        .next(getLambdaTaskInstance(['G_LAS', 'G_CSE', 'G_EDU', 'HUM'], '6'))
-        .next(
-          getLambdaTaskInstance(
-            ['SILS', 'G_HUM', 'CJL', 'SPS', 'G_WBS', 'G_PS'],
-            '7',
-          ),
-        )
-        .next(
-          getLambdaTaskInstance(
-            [
-              'G_SPS',
-              'G_IPS',
-              'G_WLS',
-              'G_E',
-              'G_SSS',
-              'G_SC',
-              'G_LAW',
-              'G_SAPS',
-              'G_SA',
-              'G_SJAL',
-              'G_SICCS',
-              'G_SEEE',
-              'EHUM',
-              'ART',
-              'CIE',
-              'G_ITS',
-            ],
-            '8',
-          ),
-        )
+      definition: planTask
+        .next(scrapeBatches)
+        .next(indexTask)
         .next(new sfn.Succeed(this, 'success', {})),
     });
 
@@ -191,17 +244,29 @@ export class SyllabusSyncPipeline extends AbstractDataPipeline {
   constructor(scope: Construct, id: string, props: DataPipelineProps) {
     super(scope, id);
 
+    // on demand, as the updates come in bursts of a whole school, e.g. at
+    // the start of a semester, and 1 WCU made the update function give up
     this.dataWarehouse = new dynamodb.Table(this, 'dynamodb-syllabus-table', {
       partitionKey: { name: 'school', type: dynamodb.AttributeType.STRING },
       sortKey: { name: 'id', type: dynamodb.AttributeType.STRING },
-      billingMode: dynamodb.BillingMode.PROVISIONED,
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
       encryption: dynamodb.TableEncryption.DEFAULT,
       removalPolicy: RemovalPolicy.RETAIN,
       timeToLiveAttribute: 'ttl',
       tableName: 'waseda-syllabus',
-      readCapacity: 1,
-      writeCapacity: 1,
     });
+    // composite key written by the update function, see get_index_values
+    if (SYLLABUS_TERM_INDEX) {
+      this.dataWarehouse.addGlobalSecondaryIndex({
+        indexName: 'SchoolTermIndex',
+        partitionKey: {
+          name: 'school_term',
+          type: dynamodb.AttributeType.STRING,
+        },
+        sortKey: { name: 'id', type: dynamodb.AttributeType.STRING },
+        projectionType: dynamodb.ProjectionType.ALL,
+      });
+    }
     //Use exsisting s3 bucket
     this.dataSource = props.dataSource!;
 
@@ -219,7 +284,10 @@ export class SyllabusSyncPipeline extends AbstractDataPipeline {
 
     this.processor.addEventSource(
       new event_sources.S3EventSource(this.dataSource, {
-        events: [s3.EventType.OBJECT_CREATED_PUT],
+        events: [
+          s3.EventType.OBJECT_CREATED_PUT,
+          s3.EventType.OBJECT_CREATED_COMPLETE_MULTIPART_UPLOAD,
+        ],
         filters: [{ prefix: 'syllabus/' }],
       }),
     );
@@ -387,3 +455,34 @@ export class ForumCommentAIDataPipeline extends AbstractDataPipeline {
     ).injectFunction;
   }
 }
+
+// keep the latest threads of each board and univ from the thread stream
+export class ForumFeedDataPipeline extends AbstractDataPipeline {
+  readonly dataSource?: s3.Bucket;
+  readonly processor: lambda.Function;
+  readonly dataWarehouse: dynamodb.Table;
+  readonly threadWarehouse: dynamodb.Table;
+
+  constructor(scope: Construct, id: string, props: DataPipelineProps) {
+    super(scope, id);
+
+    this.dataWarehouse = props.dataWarehouse!;
+    this.threadWarehouse = props.threadWareHouse!;
+
+    this.processor = new ForumFeedSyncFunction(this, 'forum-feed-function', {
+      envVars: {
+        ['TABLE_NAME']: this.threadWarehouse.tableName,
+        ['FEED_TABLE_NAME']: this.dataWarehouse.tableName,
+      },
+    }).syncFeedFunction;
+
+    this.processor.addEventSource(
+      new event_sources.DynamoEventSource(this.threadWarehouse, {
+        startingPosition: lambda.StartingPosition.LATEST,
+        batchSize: 100,
+        bisectBatchOnError: true,
+        retryAttempts: 3,
+      }),
+    );
+  }
+}
@@ -2,6 +2,8 @@ import { RemovalPolicy } from 'aws-cdk-lib';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import { Construct } from 'constructs';
 
+import { THREAD_TAG_INDEX } from '../../configs/dynamodb/indexes';
+
 export enum Collection {
   COURSE_REVIEW,
   CAREER,
@@ -12,6 +14,8 @@ export enum Collection {
   COMMENT,
   ADS,
   PROFILE, //! New profile value
+  THREAD_FEED,
+  THREAD_LIKE,
 }
 
 export class DynamoDatabase extends Construct {
@@ -100,6 +104,7 @@ export class DynamoDatabase extends Construct {
         readCapacity: 15,
         writeCapacity: 15,
         pointInTimeRecovery: true,
+        stream: dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
       },
     );
     this.tables[Collection.THREAD].addGlobalSecondaryIndex({
@@ -115,17 +120,20 @@ export class DynamoDatabase extends Construct {
       projectionType: dynamodb.ProjectionType.ALL,
     });
 
-    // this.tables[Collection.THREAD].addLocalSecondaryIndex({
-    //   indexName: 'GroupIndex',
-    //   sortKey: { name: 'group_id', type: dynamodb.AttributeType.STRING },
-    //   projectionType: dynamodb.ProjectionType.ALL,
-    // });
-
-    // this.tables[Collection.THREAD].addLocalSecondaryIndex({
-    //   indexName: 'TagIndex',
-    //   sortKey: { name: 'tag_id', type: dynamodb.AttributeType.STRING },
-    //   projectionType: dynamodb.ProjectionType.ALL,
-    // });
+    this.tables[Collection.THREAD].addGlobalSecondaryIndex({
+      indexName: 'GroupIndex',
+      partitionKey: { name: 'group_id', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'thread_id', type: dynamodb.AttributeType.STRING },
+      projectionType: dynamodb.ProjectionType.ALL,
+    });
+    if (THREAD_TAG_INDEX) {
+      this.tables[Collection.THREAD].addGlobalSecondaryIndex({
+        indexName: 'TagIndex',
+        partitionKey: { name: 'tag_id', type: dynamodb.AttributeType.STRING },
+        sortKey: { name: 'thread_id', type: dynamodb.AttributeType.STRING },
+        projectionType: dynamodb.ProjectionType.ALL,
+      });
+    }
 
     this.tables[Collection.COMMENT] = new dynamodb.Table(
       this,
@@ -177,6 +185,36 @@ export class DynamoDatabase extends Construct {
         writeCapacity: 1,
       },
     );
+
+    // latest threads of each board and univ, see sync-thread-feed
+    this.tables[Collection.THREAD_FEED] = new dynamodb.Table(
+      this,
+      'dynamodb-thread-feed-table',
+      {
+        partitionKey: { name: 'feed_key', type: dynamodb.AttributeType.STRING },
+        billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+        encryption: dynamodb.TableEncryption.DEFAULT,
+        removalPolicy: RemovalPolicy.DESTROY,
+        tableName: 'forum-thread-feeds',
+      },
+    );
+
+    // one item per like of a thread, counted in like_count of the thread
+    this.tables[Collection.THREAD_LIKE] = new dynamodb.Table(
+      this,
+      'dynamodb-thread-like-table',
+      {
+        partitionKey: { name: 'thread_id', type: dynamodb.AttributeType.STRING },
+        sortKey: { name: 'uid', type: dynamodb.AttributeType.STRING },
+        billingMode: dynamodb.BillingMode.PROVISIONED,
+        encryption: dynamodb.TableEncryption.DEFAULT,
+        removalPolicy: RemovalPolicy.RETAIN,
+        tableName: 'forum-thread-likes',
+        readCapacity: 5,
+        writeCapacity: 5,
+        pointInTimeRecovery: true,
+      },
+    );
   }
 }
 //comment to prevent empty thread
@@ -11,6 +11,7 @@ import {
   AdsDataPipeline,
   ForumThreadAIDataPipeline,
   ForumCommentAIDataPipeline,
+  ForumFeedDataPipeline,
   Worker,
 } from '../constructs/persistence/data-pipeline';
 import { Collection, DynamoDatabase } from '../constructs/persistence/database';
@@ -48,6 +49,15 @@ export class WasedaTimePersistenceLayer extends PersistenceLayer {
       },
     );
 
+    this.dataPipelines[Worker.FORUMFEED] = new ForumFeedDataPipeline(
+      this,
+      'forum-feed-datapipeline',
+      {
+        dataWarehouse: dynamoDatabase.tables[Collection.THREAD_FEED],
+        threadWareHouse: dynamoDatabase.tables[Collection.THREAD],
+      },
+    );
+
     this.dataInterface.setEndpoint(
       DataEndpoint.COURSE_REVIEWS,
       dynamoDatabase.tables[Collection.COURSE_REVIEW].tableName,
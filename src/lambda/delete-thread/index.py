@@ -1,7 +1,7 @@
 from boto3.dynamodb.conditions import Attr
 import boto3
 
-from utils import JsonPayloadBuilder, table, resp_handler
+from utils import JsonPayloadBuilder, table, resp_handler, delete_likes
 
 
 @resp_handler
@@ -15,6 +15,7 @@ def delete_thread(board_id, thread_id, uid):
         ConditionExpression=Attr('uid').eq(
             uid)
     )
+    delete_likes(thread_id)
 
     resp_body = JsonPayloadBuilder().add_status(
         True).add_data(None).add_message('').compile()
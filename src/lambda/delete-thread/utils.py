@@ -2,11 +2,14 @@ import boto3
 import json
 import logging
 import os
+from boto3.dynamodb.conditions import Key
 from decimal import Decimal
 
 # AWS DynamoDB Resources
 db = boto3.resource("dynamodb", region_name="ap-northeast-1")
 table = db.Table(os.getenv('TABLE_NAME'))
+# one item per like, type: {thread_id, uid}
+like_table = db.Table(os.getenv('LIKE_TABLE_NAME'))
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -35,6 +38,23 @@ class JsonPayloadBuilder:
         return json.dumps(self.payload, cls=DecimalEncoder, ensure_ascii=False).encode('utf8')
 
 
+def delete_likes(thread_id):
+    """
+    Delete the like items of a thread
+    :param thread_id: id of the deleted thread
+    :return:
+    """
+    query = {"KeyConditionExpression": Key('thread_id').eq(thread_id), "ProjectionExpression": "thread_id, uid"}
+    with like_table.batch_writer() as batch:
+        while True:
+            response = like_table.query(**query)
+            for item in response['Items']:
+                batch.delete_item(Key=item)
+            if 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
 def api_response(code, body):
     return {
         "isBase64Encoded": False,
@@ -1,56 +1,114 @@
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Key, Attr
 import boto3
+import heapq
+import itertools
 from datetime import datetime
-from utils import JsonPayloadBuilder, table, resp_handler, s3_client, bucket, generate_url
+from utils import JsonPayloadBuilder, table, resp_handler, s3_client, bucket, generate_urls, encode_cursor, \
+    decode_cursor, filter_indexes, filter_read_size, feed_size, read_feed, get_liked_threads, count_likes
+
+
+def iter_threads(page_size, **query):
+    """
+    Query threads newest first, following LastEvaluatedKey until the caller stops reading
+    :param page_size: Limit of each query
+    :param query: arguments of table.query
+    :return: generator of threads
+    """
+    while True:
+        response = table.query(Limit=page_size, ScanIndexForward=False, **query)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
 
 @resp_handler
-def get_all_threads(uid, index, num, school, tags, board_id):
+def get_all_threads(uid, index, num, school, tags, board_id, univ_id, cursor):
     index = int(index)
     num = int(num)
 
-    if board_id:
-        response = table.query(KeyConditionExpression=Key(
-            "board_id").eq(board_id), ScanIndexForward=False)
+    # a thread has only one school and one tag, so the threads of several values can be merged from an index
+    merged = None
+    if not board_id and school and "group_id" in filter_indexes:
+        merged = ("group_id", school)
+    elif not board_id and tags and not school and "tag_id" in filter_indexes:
+        merged = ("tag_id", tags)
+
+    # thread_id starts with the creation time, so every order below is newest first
+    if merged is None:
+        if board_id:
+            query = {'KeyConditionExpression': Key("board_id").eq(board_id)}
+            key_names = ("board_id", "thread_id")
+        else:
+            query = {'IndexName': 'UnivIDbyThreadIDIndex', 'KeyConditionExpression': Key("univ_id").eq(univ_id)}
+            key_names = ("board_id", "thread_id", "univ_id")
+        conditions = []
+        if school:
+            conditions.append(Attr("group_id").is_in(school))
+        if tags:
+            conditions.append(Attr("tag_id").is_in(tags))
+        if conditions:
+            query['FilterExpression'] = conditions[0] if len(conditions) == 1 else conditions[0] & conditions[1]
+        # the legacy index skips threads, the cursor continues right after the last thread of the previous page
+        if cursor:
+            query['ExclusiveStartKey'] = decode_cursor(cursor, key_names)
+            index = 0
+        page_size = max(index + num, filter_read_size) if conditions else index + num
+        # the first page is a single read of the materialized feed
+        threads = None
+        if index == 0 and not cursor and not conditions and num <= feed_size:
+            threads = read_feed(board_id, univ_id)
+        if threads is None:
+            threads = iter_threads(page_size, **query)
     else:
-        response = table.scan(ConsistentRead=False)
-
-    items = response['Items']
-
-    if school:
-        items = [item for item in items if item.get("group_id") in school]
-    if tags:
-        items = [item for item in items if item.get("tag_id") in tags]
-
-    if not board_id:
-        items = sorted(items, key=lambda x: x.get(
-            'created_at', ''), reverse=True)
-
-    start_index = index
-    end_index = min(len(items), start_index+num)
-    paginated_items = items[start_index:end_index]
-
+        # one query per school, or per tag, merged by thread_id
+        name, values = merged
+        index_name = filter_indexes[name]
+        # the indexes span every univ, threads of other univs are filtered out
+        condition = Attr("univ_id").eq(univ_id)
+        if school and tags:
+            condition = condition & Attr("tag_id").is_in(tags)
+        key_names = ("thread_id",)
+        before = None
+        if cursor:
+            before = decode_cursor(cursor, key_names)["thread_id"]
+            index = 0
+        # threads of other univs are rare, only the tags filter needs the larger reads
+        page_size = max(index + num, filter_read_size) if school and tags else index + num
+        streams = []
+        for value in values:
+            key_condition = Key(name).eq(value)
+            if before:
+                key_condition = key_condition & Key("thread_id").lt(before)
+            streams.append(iter_threads(page_size, IndexName=index_name, KeyConditionExpression=key_condition,
+                                        FilterExpression=condition))
+        threads = heapq.merge(*streams, key=lambda item: item["thread_id"], reverse=True)
+
+    paginated_items = list(itertools.islice(threads, index, index + num))
+    end_index = index + len(paginated_items)
+    next_cursor = None
+    if paginated_items and len(paginated_items) == num:
+        next_cursor = encode_cursor({key: paginated_items[-1][key] for key in key_names})
+
+    urls = generate_urls(bucket, [item['obj_key'] for item in paginated_items if 'obj_key' in item])
+    liked = get_liked_threads(uid, [item['thread_id'] for item in paginated_items if item.get('like_count')])
     for item in paginated_items:
         item['mod'] = False
         if 'uid' in item and item['uid'] == uid:
             item['mod'] = True
-        item['user_liked'] = uid in item.get('likes', [])
-        item['total_likes'] = len(item.get('likes', []))
-
-        presigned_url = None
+        item['user_liked'] = uid in item.get('likes', []) or item['thread_id'] in liked
+        item['total_likes'] = count_likes(item)
 
-        if "obj_key" in item:
-            bucket_name = bucket
-            presigned_url = generate_url(bucket_name, item["obj_key"])
-        if presigned_url:
-            item["url"] = presigned_url
+        if item.get("obj_key") in urls:
+            item["url"] = urls[item["obj_key"]]
 
         item.pop('uid', None)
         item.pop('likes', None)
+        item.pop('like_count', None)
         item.pop('obj_key', None)
 
     body = JsonPayloadBuilder().add_status(
-        True).add_data(paginated_items).add_message(end_index).compile()
+        True).add_data(paginated_items).add_message(end_index).add_cursor(next_cursor).compile()
 
     return body
 
@@ -65,10 +123,12 @@ def handler(event, context):
         num = params.get("num", 10)
         school = params.get("school", "")
         tags = params.get("tags", "")
+        univ_id = params.get("univ_id", "1")
+        cursor = params.get("cursor", "")
 
         if school:
             school = school.split(',')
         if tags:
             tags = tags.split(',')
 
-    return get_all_threads(uid, index, num, school, tags, board_id)
+    return get_all_threads(uid, index, num, school, tags, board_id, univ_id, cursor)
@@ -1,15 +1,43 @@
+import base64
 import boto3
 import json
 import logging
 import os
+import time
+from collections import OrderedDict
+from botocore.exceptions import ClientError
 from decimal import Decimal
 
 db = boto3.resource("dynamodb", region_name="ap-northeast-1")
 table = db.Table(os.getenv('TABLE_NAME'))
+# one item per like, type: {thread_id, uid}
+like_table = db.Table(os.getenv('LIKE_TABLE_NAME'))
+
+feed_table = db.Table(os.getenv('FEED_TABLE_NAME'))
 
 s3_client = boto3.client('s3')
 bucket = os.getenv('BUCKET_NAME')
 
+# signed urls are reused by a container until they have less than url_refresh_margin seconds left
+url_expiration = 3600
+url_refresh_margin = 1200
+url_cache_size = 1024
+# LRU of the signed urls, type: {(bucket, key): (expire time, url)}
+url_cache = OrderedDict()
+
+# secondary indexes of the filters, type: {attribute: index name}.
+# CloudFormation creates one GSI per table update, filters without an index yet are applied after the read
+filter_indexes = {"group_id": "GroupIndex"}
+# TagIndex is created by the deploy after GroupIndex, which sets TAG_INDEX
+if os.getenv('TAG_INDEX') == 'true':
+    filter_indexes["tag_id"] = "TagIndex"
+
+# num of threads read per query when filtering by school or tags, as the filter is applied after the limit
+filter_read_size = 50
+
+# num of latest threads kept in a feed by sync-thread-feed
+feed_size = 30
+
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -19,7 +47,9 @@ class DecimalEncoder(json.JSONEncoder):
 
 
 class JsonPayloadBuilder:
-    payload = {}
+    def __init__(self):
+        # one payload per builder, a class attribute would carry the cursor of a page into later error responses
+        self.payload = {}
 
     def add_status(self, success):
         self.payload['success'] = success
@@ -33,6 +63,10 @@ class JsonPayloadBuilder:
         self.payload['message'] = msg
         return self
 
+    def add_cursor(self, cursor):
+        self.payload['cursor'] = cursor
+        return self
+
     def compile(self):
         return json.dumps(self.payload, cls=DecimalEncoder, ensure_ascii=False).encode('utf8')
 
@@ -51,6 +85,10 @@ def api_response(code, body):
     }
 
 
+class InvalidCursor(Exception):
+    pass
+
+
 def resp_handler(func):
     def handle(*args, **kwargs):
         try:
@@ -60,6 +98,11 @@ def resp_handler(func):
             resp = JsonPayloadBuilder().add_status(False).add_data(None) \
                 .add_message("Not found").compile()
             return api_response(404, resp)
+        except InvalidCursor as e:
+            logging.warning(f"Invalid cursor: {e}")
+            resp = JsonPayloadBuilder().add_status(False).add_data(None) \
+                .add_message("Invalid cursor").compile()
+            return api_response(400, resp)
         except Exception as e:
             logging.error(str(e))
             resp = JsonPayloadBuilder().add_status(False).add_data(None) \
@@ -69,7 +112,87 @@ def resp_handler(func):
     return handle
 
 
-def generate_url(bucket_name, object_key, expiration=3600):
+def read_feed(board_id, univ_id):
+    """
+    Read the latest threads of a board, or of a univ without board_id, materialized by sync-thread-feed
+    :return: list of threads newest first, or None if the feed is not materialized yet
+    """
+    feed_key = f"board#{board_id}" if board_id else f"univ#{univ_id}"
+    try:
+        item = feed_table.get_item(Key={'feed_key': feed_key}).get('Item')
+    except ClientError as e:
+        logging.error(str(e))
+        return None
+    return item['threads'] if item else None
+
+
+def encode_cursor(key):
+    """
+    :param key: key of the last returned thread, as ExclusiveStartKey of the next query
+    :return: opaque url-safe string
+    """
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf8')).decode('ascii')
+
+
+def decode_cursor(cursor, key_names):
+    """
+    :param cursor: string from encode_cursor
+    :param key_names: names of the keys the cursor must hold, those of the query it continues
+    :return: dict, ExclusiveStartKey of the query
+    :raise InvalidCursor: if the cursor is not one of encode_cursor with these keys
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError as e:
+        # binascii.Error, UnicodeError and JSONDecodeError are all ValueError
+        raise InvalidCursor(str(e))
+    if not isinstance(key, dict) or set(key) != set(key_names) \
+            or not all(isinstance(value, str) for value in key.values()):
+        raise InvalidCursor(f"Expected the keys {key_names}")
+    return key
+
+
+def get_liked_threads(uid, thread_ids):
+    """
+    Check which threads a user liked with BatchGetItem on the like table, instead of reading whole likes sets
+    :param uid: user id
+    :param thread_ids: ids of the threads on the page
+    :return: set of the liked thread ids
+    """
+    liked = set()
+    if not uid:
+        return liked
+    keys = [{"thread_id": thread_id, "uid": uid} for thread_id in thread_ids]
+    for i in range(0, len(keys), 100):
+        request = {like_table.name: {'Keys': keys[i:i + 100], 'ProjectionExpression': 'thread_id'}}
+        while request:
+            response = db.meta.client.batch_get_item(RequestItems=request)
+            liked.update(item['thread_id'] for item in response['Responses'].get(like_table.name, []))
+            request = response.get('UnprocessedKeys')
+    return liked
+
+
+def count_likes(item):
+    """
+    :param item: thread item, liked through like_count or the legacy likes set before its migration
+    :return: int
+    """
+    return int(item.get('like_count', 0)) + len(item.get('likes', []))
+
+
+def generate_url(bucket_name, object_key, expiration=url_expiration):
+    """
+    Presign a get_object url, reusing the one signed by this container while it is still valid long enough
+    :param bucket_name: bucket of the object
+    :param object_key: key of the object
+    :param expiration: seconds the url is valid for
+    :return: url, or None if signing failed
+    """
+    now = time.time()
+    cached = url_cache.get((bucket_name, object_key))
+    if cached and cached[0] - url_refresh_margin > now:
+        url_cache.move_to_end((bucket_name, object_key))
+        return cached[1]
     try:
         response = s3_client.generate_presigned_url('get_object',
                                                     Params={'Bucket': bucket_name,
@@ -79,4 +202,23 @@ def generate_url(bucket_name, object_key, expiration=3600):
         logging.error(str(e))
         return None
 
+    url_cache[(bucket_name, object_key)] = (now + expiration, response)
+    url_cache.move_to_end((bucket_name, object_key))
+    if len(url_cache) > url_cache_size:
+        url_cache.popitem(last=False)
     return response
+
+
+def generate_urls(bucket_name, object_keys, expiration=url_expiration):
+    """
+    Presign the urls of a page of objects in one pass
+    :param bucket_name: bucket of the objects
+    :param object_keys: keys of the objects, duplicates are signed once
+    :param expiration: seconds the urls are valid for
+    :return: {key: url}, without the keys that failed
+    """
+    urls = {}
+    for object_key in object_keys:
+        if object_key not in urls:
+            urls[object_key] = generate_url(bucket_name, object_key, expiration)
+    return {object_key: url for object_key, url in urls.items() if url}
@@ -1,5 +1,5 @@
 from boto3.dynamodb.conditions import Key
-from utils import JsonPayloadBuilder, table, resp_handler, bucket, generate_url
+from utils import JsonPayloadBuilder, table, resp_handler, bucket, generate_urls
 
 
 @resp_handler
@@ -13,14 +13,11 @@ def get_career(job_type, uid):
         response = table.scan()
 
     items = response.get('Items', [])
+    urls = generate_urls(bucket, [item.get(field, "") for item in items for field in ('hero_image', 'company_logo')])
 
     for item in items:
-        hero_image_key = item.get('hero_image', "")
-        company_logo_key = item.get('company_logo', "")
-        hero_image = generate_url(bucket, hero_image_key)
-        company_logo = generate_url(bucket, company_logo_key)
-        item['hero_image'] = hero_image
-        item['company_logo'] = company_logo       
+        item['hero_image'] = urls.get(item.get('hero_image', ""))
+        item['company_logo'] = urls.get(item.get('company_logo', ""))
         applicants = item.get('applicants', set())
         item['applicant_count'] = len(applicants)
         item['applied'] = uid in applicants
@@ -2,6 +2,8 @@ import boto3
 import json
 import logging
 import os
+import time
+from collections import OrderedDict
 from decimal import Decimal
 
 db = boto3.resource("dynamodb", region_name="ap-northeast-1")
@@ -10,6 +12,13 @@ table = db.Table(os.getenv('TABLE_NAME'))
 s3_client = boto3.client('s3')
 bucket = os.getenv('BUCKET_NAME')
 
+# signed urls are reused by a container until they have less than url_refresh_margin seconds left
+url_expiration = 3600
+url_refresh_margin = 1200
+url_cache_size = 1024
+# LRU of the signed urls, type: {(bucket, key): (expire time, url)}
+url_cache = OrderedDict()
+
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -69,7 +78,19 @@ def resp_handler(func):
     return handle
 
 
-def generate_url(bucket_name, object_key, expiration=3600):
+def generate_url(bucket_name, object_key, expiration=url_expiration):
+    """
+    Presign a get_object url, reusing the one signed by this container while it is still valid long enough
+    :param bucket_name: bucket of the object
+    :param object_key: key of the object
+    :param expiration: seconds the url is valid for
+    :return: url, or None if signing failed
+    """
+    now = time.time()
+    cached = url_cache.get((bucket_name, object_key))
+    if cached and cached[0] - url_refresh_margin > now:
+        url_cache.move_to_end((bucket_name, object_key))
+        return cached[1]
     try:
         response = s3_client.generate_presigned_url('get_object',
                                                     Params={'Bucket': bucket_name,
@@ -79,4 +100,23 @@ def generate_url(bucket_name, object_key, expiration=3600):
         logging.error(str(e))
         return None
 
+    url_cache[(bucket_name, object_key)] = (now + expiration, response)
+    url_cache.move_to_end((bucket_name, object_key))
+    if len(url_cache) > url_cache_size:
+        url_cache.popitem(last=False)
     return response
+
+
+def generate_urls(bucket_name, object_keys, expiration=url_expiration):
+    """
+    Presign the urls of a page of objects in one pass
+    :param bucket_name: bucket of the objects
+    :param object_keys: keys of the objects, duplicates are signed once
+    :param expiration: seconds the urls are valid for
+    :return: {key: url}, without the keys that failed
+    """
+    urls = {}
+    for object_key in object_keys:
+        if object_key not in urls:
+            urls[object_key] = generate_url(bucket_name, object_key, expiration)
+    return {object_key: url for object_key, url in urls.items() if url}
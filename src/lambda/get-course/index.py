@@ -1,11 +1,17 @@
+from utils import CourseCache
 from utils import JsonPayloadBuilder
+from utils import course_id_pattern
 from utils import resp_handler
 from utils import scrape_course
 
+course_cache = CourseCache(scrape_course)
+
 
 @resp_handler
 def get_course(id):
-    result = scrape_course(id)
+    if not course_id_pattern.fullmatch(id):
+        raise LookupError
+    result = course_cache.get(id)
     if not result:
         raise LookupError
 
@@ -1,12 +1,22 @@
-import itertools
+import boto3
 import json
 import logging
+import os
 import re
-import unicodedata
+import threading
+import time
 import urllib.request as requests
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures.thread import ThreadPoolExecutor
 from const import *
 from decimal import Decimal
-from lxml import html
+from syllabus import index_course, parse_course, scrape_text, to_half_width
+
+
+# shared by the invocations of the container, so pages of a course are fetched in parallel
+fetcher = ThreadPoolExecutor(max_workers=4)
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -80,289 +90,162 @@ def build_url(lang, course_id):
     return f"https://www.wsl.waseda.jp/syllabus/JAA104.php?pKey={course_id}&pLng={lang}"
 
 
-def scrape_course(course_id):
-    req_en = requests.Request(url=build_url('en', course_id))
-    req_jp = requests.Request(url=build_url('jp', course_id))
-    parsed_en = html.fromstring(requests.urlopen(req_en).read())
-    parsed_jp = html.fromstring(requests.urlopen(req_jp).read())
-    info_en = parsed_en.xpath(query["info_table"])[0]
-    info_jp = parsed_jp.xpath(query["info_table"])[0]
-    # TODO optimize code structure
-    locations = scrape_info(info_en, 'classroom', parse_location)
-    periods = scrape_info(info_en, 'occurrence', parse_period)
-    return {
-        "id": course_id,
-        "title": scrape_info(info_en, 'title', to_half_width),
-        "title_jp": scrape_info(info_jp, 'title', to_half_width),
-        "instructor": scrape_info(info_en, 'instructor', to_half_width),
-        "instructor_jp": scrape_info(info_jp, 'instructor', to_half_width),
-        "lang": scrape_info(info_en, 'lang', parse_lang),
-        "type": scrape_info(info_jp, 'type', to_enum(type_enum_map)),
-        "term": scrape_info(info_en, 'occurrence', parse_term),
-        "occ": merge_period_location(periods, locations),
-        "year": scrape_info(info_en, 'min_year', parse_min_year),
-        "cat": scrape_info(info_en, 'category', to_half_width),
-        "cred": scrape_info(info_en, 'credit', parse_credit),
-        "lvl": scrape_info(info_jp, 'level', to_enum(level_enum_map)),
-        "eval": get_eval_criteria(parsed_en),
-        "code": scrape_info(info_jp, 'code', None),
-        "sub": scrape_text(parsed_en, "Subtitle", to_half_width),
-        "cat_jp": scrape_info(info_jp, 'category', to_half_width),
-        "mod": scrape_info(info_jp, 'modality', to_enum(modality_enum_map)),
-        "outline": scrape_text(parsed_en, "Course Outline", to_half_width),
-        "obj": scrape_text(parsed_en, "Objectives", to_half_width),
-        "self_study": scrape_text(parsed_en, "before/after course of study", to_half_width),
-        "schedule": scrape_text(parsed_en, "Course Schedule", to_half_width),
-        "text": scrape_text(parsed_en, "Textbooks", to_half_width),
-        "ref": scrape_text(parsed_en, "Reference", to_half_width),
-        "note": scrape_text(parsed_en, "Note / URL", to_half_width),
-    }
-
-
-def scrape_info(parsed, key, fn):
-    """
-    Extract info from parsed and let it processed by fn
-    :param parsed: parsed html section
-    :param key: category of info
-    :param fn: function used to transform data
-    :return: scraped information
-    """
-    section = parsed.xpath(query[key])
-    # special cases if modality not present
-    if (key == "code" or key == "level" or key == "type") and scrape_info(parsed, 'modality',
-                                                                          to_enum(modality_enum_map)) == -1:
-        section = parsed.xpath(query[f"{key}_old"])
-    if section:
-        if not fn:
-            return section[0]
-        return fn(section[0])
-    return ""
-
-
-def to_half_width(s):
+def fetch_pages(urls, timeout=fetch_timeout):
     """
-    Converts zenkaku to hankaku
-    :param s:
-    :return:
+    Fetch pages concurrently within a shared deadline
+    :param urls: list of urls
+    :param timeout: seconds before giving up on the pages not fetched yet
+    :return: list of raw html, None for the pages failed or timed out
     """
-    if not s:
-        return ""
-    return unicodedata.normalize('NFKC', s)
+    deadline = time.time() + timeout
+    futures = [fetcher.submit(fetch_page, url, timeout) for url in urls]
+    pages = []
+    for url, future in zip(urls, futures):
+        try:
+            pages.append(future.result(timeout=max(deadline - time.time(), 0)))
+        except Exception as e:
+            logging.warning(f"Unable to fetch {url}: {e!r}")
+            pages.append(None)
+    return pages
+
+
+def fetch_page(url, timeout):
+    return requests.urlopen(requests.Request(url=url), timeout=timeout).read()
 
-# Fix the problem over here to get the correct evaluation criteria in the waseda time 
-def get_eval_criteria(parsed):
+
+def scrape_course(course_id):
     """
-    Get the evaluation criteria from course detail page
+    Scrape a course from its EN and JP pages, which are fetched concurrently.
+    If only the JP page is unavailable, the course is returned without its JP fields and marked as partial.
+    :param course_id:
+    :return: dict
+    """
+    body_en, body_jp = fetch_pages([build_url('en', course_id), build_url('jp', course_id)])
+    if body_en is None:
+        raise ConnectionError(f"Unable to fetch course {course_id}")
+    info_en, info_jp, texts_en = index_course(body_en, body_jp)
+    course = dict(zip(course_keys, parse_course(course_id, info_en, info_jp, texts_en, flatten=False)))
+    course["eval"] = get_eval(texts_en, course["eval"])
+    for key, row_name in text_rows.items():
+        course[key] = scrape_text(texts_en, row_name, to_half_width, full=True)
+    if body_jp is None:
+        course["partial"] = True
+    return course
+
+
+def get_eval(texts, evals):
+    """
+    Convert the evaluation criteria to the response format
+    :param texts: syllabus texts indexed by get_syllabus_texts
+    :param evals: evaluation criteria parsed by get_eval_criteria
     :return: array :=
         [{
-            "t": 'enum' # type
-            "p": 'int' # percent
-            "c": 'string' #criteria
+            "type": 'enum'
+            "percent": 'int'
+            "criteria": 'string'
         }]
+        or the raw text if the evaluation is not given as a table
     """
-    table = get_syllabus_texts(parsed, "Evaluation")
-    if table is None:
-        return []
-    evals = []
-    rows = table.xpath('table//tr')
-    # Case 1: the only row is the table header
-    if len(rows) < 2:
+    table = texts.get("Evaluation")
+    if not evals and table is not None:
         return table.text_content()
-    # Case 2: 2 or more rows
-    for r in rows[1:]:
-        elem = r.getchildren()
-        # kind = elem[0].text
-        # New code to deal with the new line character
-        kind = elem[0].text.rstrip()
-        percent = elem[1].text.strip()[:-1] or -1
+    return [{"type": e["t"], "percent": e["p"], "criteria": e["c"]} for e in evals]
+
+
+course_id_pattern = re.compile(r"\w{28}")
+
+
+class CourseCache:
+    """
+    Read-through cache of scraped courses, an LRU in the container backed by one s3 object per course.
+    Concurrent misses of the same course wait for a single scrape instead of starting their own.
+    """
+
+    def __init__(self, loader, size=cache_size, ttl=cache_ttl):
+        """
+        :param loader: function scraping a course by its id
+        :param size: max num of courses kept in the container
+        :param ttl: seconds before a cached course is scraped again
+        """
+        self.loader = loader
+        self.size = size
+        self.ttl = ttl
+        # type: {course_id: (expire_at, course)}
+        self.entries = OrderedDict()
+        # scrapes in progress, type: {course_id: Future}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.bucket = os.getenv('BUCKET_NAME')
+        self.path = os.getenv('OBJECT_PATH', 'course/')
+        self.s3 = boto3.client('s3') if self.bucket else None
+
+    def get(self, course_id):
+        """
+        :param course_id:
+        :return: course, see scrape_course
+        """
+        with self.lock:
+            entry = self.entries.get(course_id)
+            if entry and entry[0] > time.time():
+                self.entries.move_to_end(course_id)
+                return entry[1]
+            future = self.pending.get(course_id)
+            owner = future is None
+            if owner:
+                future = self.pending[course_id] = Future()
+        if not owner:
+            return future.result()
         try:
-            percent = int(percent)
-        except ValueError:
-            logging.warning(f"Unable to parse percent: {percent}")
-        # criteria = to_half_width(elem[2].text)
-        # New code to deal with the breakline
-        criteria_elements = elem[2].xpath('.//text()')
-        criteria = to_half_width(''.join(criteria_elements))
-        evals.append({
-            "type": to_enum(eval_type_map)(kind),
-            "percent": percent,
-            "criteria": criteria
-        })
-    return evals
-
-
-def scrape_text(parsed, row_name, fn):
-    element = get_syllabus_texts(parsed, row_name)
-    if element is not None:
-        for br in element.xpath("*//br"):
-            br.tail = "\n" + br.tail if br.tail else "\n"
-        return fn(element.text_content())
-    return ""
-
-
-def get_syllabus_texts(course_html, row_name=None):
-    """
-    Get all the "Syllabus Information" in course details page
-    :param row_name: the name of which row to extract
-    :param course_html: parsed html
-    :return: dict:=
-        {
-            row1_name: row1_content,
-            ...
-        }
-        or an Element if row_name is specified
-        or None if nothing matched
-    """
-    if course_html is None:
-        return None
-    rows = course_html.xpath(query["text_table"])
-    row_names = [(row.xpath(query["row_name"]) or [""])[0] for row in rows]
-    for i in range(len(row_names)):
-        if row_name == row_names[i]:
-            content = rows[i].xpath(query["row_content"])
-            if content:
-                return content[0]
-            return None
-    return None
-
-
-def merge_period_location(periods, locations):
-    """
-    Join location with period
-    :param periods: list
-    :param locations: list
-    :return: array of dict
-    """
-    occurrences = []
-    # Case 1: multiple periods but only one location
-    if len(locations) == 1:
-        for p in periods:
-            p["l"] = locations[0]
-        return periods
-    # TODO find other cases
-    # Case 2: More no. of periods than no. of locations
-    zipped = list(itertools.zip_longest(periods, locations))
-    for (p, loc) in zipped:
-        p["l"] = loc
-        occurrences.append(p)
-    return occurrences
-
-
-def parse_min_year(eligible_year):
-    """
-    Parse minimum eligible year
-    :param eligible_year: string
-    :return: int
-    """
-    if not eligible_year:
-        return -1
-    if eligible_year[0].isdigit():
-        return int(eligible_year[0])
-    return -1
-
-
-def parse_location(loc):
-    """
-    Parse a series of locations
-    :param loc: string
-    :return: list
-    """
-    # Case 1: no location
-    if loc.isspace():
-        return ["undecided"]
-    # Case 2: a single location
-    if len(loc.split('／')) == 1:
-        return [to_half_width(loc)]
-    # Case 3: multiple 'period:location' separated by /
-    rooms = []
-    locations = loc.split('／')
-    for l in locations:
-        match = re.search(r'0(\d):(.*)', l)
-        count, classroom = int(match.group(1)) - 1, match.group(2)
-        classroom = to_half_width(classroom)
-        # Sub-case: two location records for same period
-        if count >= len(rooms):
-            rooms.append(classroom)
-        else:
-            rooms.__setitem__(count, rooms[count] + "/" + classroom)
-        return rooms
-
-
-def parse_lang(lang):
-    if lang == "N/A":
-        return [-1]
-    langs = lang.split('/')
-    lang_list = [to_enum(lang_enum_map)(l) for l in langs]
-    return lang_list
-
-
-def parse_term(schedule):
-    """
-    Parse the term from string 'term  day/period'
-    :param schedule: string
-    :return: string(encoded_term)
-    """
-    try:
-        (term, _) = schedule.split(u'\xa0\xa0', 1)
-    except ValueError:
-        logging.warning(f"Unable to parse term from '{schedule}'")
-        return "undecided"
-    if term not in term_enum_map.keys():
-        logging.error(f"Unknown term '{term}'")
-        return ""
-    return to_enum(term_enum_map)(term)
-
-
-def parse_period(schedule):
-    """
-    Extract day and period from raw data
-    :param schedule: string
-    :return: term and occurrence(list)
-    """
-    # TODO optimize code structure
-    try:
-        (_, occ) = schedule.split(u'\xa0\xa0', 1)
-    except ValueError:
-        logging.warning(f"Unable to parse period: {schedule}")
-        return []
-    if occ == "othersothers":
-        return [{"d": -1, "p": -1}]
-    if occ == "othersOn demand":
-        return [{"d": -1, "p": 0}]
-    occ_matches = re.finditer(r'(Mon|Tues|Wed|Thur|Fri|Sat|Sun)\.(\d-\d|\d|On demand)', occ)
-    occurrences = []
-    for match in occ_matches:
-        day, period = match.group(1), match.group(2)
-        day = to_enum(weekday_enum_map)(day)
-        if period is None:
-            period = -1
-        elif period == "On demand":
-            period = 0
-        elif period.isdigit():
-            period = int(period)
-        else:
-            p1, p2 = period.split('-', 1)
-            period = int(p1) * 10 + int(p2)
-        occurrences.append({"d": day, "p": period})
-    return occurrences
-
-
-def parse_credit(credit):
-    if credit.isdigit():
-        return int(credit)
-    return -1
-
-
-def to_enum(enum_map):
-    def map_to_int(data):
-        if not data:
-            return -1
-        if data == u'\xa0':
-            return -1
+            expire_at, course = self.load(course_id)
+            if not course.get("partial"):
+                with self.lock:
+                    self.entries[course_id] = (expire_at, course)
+                    self.entries.move_to_end(course_id)
+                    while len(self.entries) > self.size:
+                        self.entries.popitem(last=False)
+            future.set_result(course)
+            return course
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[course_id]
+
+    def load(self, course_id):
+        """
+        Read the course from s3, or scrape it if the object is missing or expired.
+        An expired object is still served if the scrape fails, e.g. during an outage of the syllabus site.
+        :param course_id:
+        :return: (expire_at, course)
+        """
+        if not self.s3:
+            return time.time() + self.ttl, self.loader(course_id)
+        key = self.path + course_id + '.json'
+        stale = None
         try:
-            return enum_map[data]
-        except KeyError:
-            logging.warning(f"Unable to map '{data}' to integer")
-            return -1
-
-    return map_to_int
+            obj = self.s3.get_object(Bucket=self.bucket, Key=key)
+            expire_at = obj['LastModified'].timestamp() + self.ttl
+            stale = json.loads(obj['Body'].read())
+            if expire_at > time.time():
+                return expire_at, stale
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                logging.warning(f"Unable to read cached course {course_id}: {e}")
+        try:
+            course = self.loader(course_id)
+        except Exception as e:
+            if stale is None:
+                raise
+            logging.warning(f"Serving expired course {course_id}, unable to scrape it: {e}")
+            # expired at once, so the next request tries to scrape it again
+            return time.time(), stale
+        # partial courses are served but not cached, so the next request scrapes them again
+        if course.get("partial"):
+            return time.time(), course
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=key, ContentType='application/json; charset=utf-8',
+                               Body=json.dumps(course, ensure_ascii=False).encode('utf8'))
+        except ClientError as e:
+            logging.warning(f"Unable to cache course {course_id}: {e}")
+        return time.time() + self.ttl, course
@@ -1,6 +1,7 @@
 from boto3.dynamodb.conditions import Key, Attr
 from datetime import datetime
-from utils import JsonPayloadBuilder, table, resp_handler, s3_client, bucket, generate_url
+from utils import JsonPayloadBuilder, table, resp_handler, s3_client, bucket, generate_url, get_liked_threads, \
+    count_likes
 
 
 @resp_handler
@@ -53,8 +54,9 @@ def get_single_thread(board_id, thread_id, uid=""):
     item["mod"] = False
     if item["uid"] == uid:
         item["mod"] = True
-    item['user_liked'] = uid in item.get('likes', [])
-    item['total_likes'] = len(item.get('likes', []))
+    item['user_liked'] = uid in item.get('likes', []) or \
+        bool(item.get('like_count')) and thread_id in get_liked_threads(uid, [thread_id])
+    item['total_likes'] = count_likes(item)
 
     if "obj_key" in item:
         bucket_name = bucket
@@ -64,6 +66,7 @@ def get_single_thread(board_id, thread_id, uid=""):
 
     item.pop('uid', None)
     item.pop('likes', None)
+    item.pop('like_count', None)
     item.pop('obj_key', None)
 
     body = JsonPayloadBuilder().add_status(
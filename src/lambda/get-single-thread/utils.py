@@ -2,14 +2,25 @@ import boto3
 import json
 import logging
 import os
+import time
+from collections import OrderedDict
 from decimal import Decimal
 
 db = boto3.resource("dynamodb", region_name="ap-northeast-1")
 table = db.Table(os.getenv('TABLE_NAME'))
+# one item per like, type: {thread_id, uid}
+like_table = db.Table(os.getenv('LIKE_TABLE_NAME'))
 
 s3_client = boto3.client('s3')
 bucket = os.getenv('BUCKET_NAME')
 
+# signed urls are reused by a container until they have less than url_refresh_margin seconds left
+url_expiration = 3600
+url_refresh_margin = 1200
+url_cache_size = 1024
+# LRU of the signed urls, type: {(bucket, key): (expire time, url)}
+url_cache = OrderedDict()
+
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -69,7 +80,47 @@ def resp_handler(func):
     return handle
 
 
-def generate_url(bucket_name, object_key, expiration=3600):
+def get_liked_threads(uid, thread_ids):
+    """
+    Check which threads a user liked with BatchGetItem on the like table, instead of reading whole likes sets
+    :param uid: user id
+    :param thread_ids: ids of the threads on the page
+    :return: set of the liked thread ids
+    """
+    liked = set()
+    if not uid:
+        return liked
+    keys = [{"thread_id": thread_id, "uid": uid} for thread_id in thread_ids]
+    for i in range(0, len(keys), 100):
+        request = {like_table.name: {'Keys': keys[i:i + 100], 'ProjectionExpression': 'thread_id'}}
+        while request:
+            response = db.meta.client.batch_get_item(RequestItems=request)
+            liked.update(item['thread_id'] for item in response['Responses'].get(like_table.name, []))
+            request = response.get('UnprocessedKeys')
+    return liked
+
+
+def count_likes(item):
+    """
+    :param item: thread item, liked through like_count or the legacy likes set before its migration
+    :return: int
+    """
+    return int(item.get('like_count', 0)) + len(item.get('likes', []))
+
+
+def generate_url(bucket_name, object_key, expiration=url_expiration):
+    """
+    Presign a get_object url, reusing the one signed by this container while it is still valid long enough
+    :param bucket_name: bucket of the object
+    :param object_key: key of the object
+    :param expiration: seconds the url is valid for
+    :return: url, or None if signing failed
+    """
+    now = time.time()
+    cached = url_cache.get((bucket_name, object_key))
+    if cached and cached[0] - url_refresh_margin > now:
+        url_cache.move_to_end((bucket_name, object_key))
+        return cached[1]
     try:
         response = s3_client.generate_presigned_url('get_object',
                                                     Params={'Bucket': bucket_name,
@@ -79,4 +130,8 @@ def generate_url(bucket_name, object_key, expiration=3600):
         logging.error(str(e))
         return None
 
+    url_cache[(bucket_name, object_key)] = (now + expiration, response)
+    url_cache.move_to_end((bucket_name, object_key))
+    if len(url_cache) > url_cache_size:
+        url_cache.popitem(last=False)
     return response
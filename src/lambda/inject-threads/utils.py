@@ -8,6 +8,7 @@ import uuid
 from boto3.dynamodb.conditions import Key
 import random
 import re
+from syllabus import decode_columns
 
 db = boto3.resource("dynamodb", region_name="ap-northeast-1")
 table = db.Table(os.getenv('THREAD_TABLE_NAME'))
@@ -20,7 +21,9 @@ UID = os.getenv('UID')
 UNIV_ID = "1"
 
 
-file_key = 'syllabus/SILS.json'
+file_key = 'syllabus/columnar/SILS.json'
+# written by the scraper since the columnar export, read until the first scrape after deploy
+fallback_file_key = 'syllabus/SILS.json'
 
 bedrock_client = boto3.client('bedrock-runtime', region_name='ap-northeast-1')
 
@@ -125,21 +128,32 @@ def fetch_threads():
     return json.dumps(categorized_threads)
 
 
-def fetch_timetable():
-    response = s3_client.get_object(Bucket=bucket, Key=file_key)
-    file_content = response['Body'].read().decode('utf-8')
+def fetch_columns(fields):
+    """
+    Read some fields of all the courses, from the columnar syllabus or the plain one if it is not written yet
+    :param fields: keys of the fields
+    :return: dict := {key: list of the values of all courses}
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=file_key)
+    except s3_client.exceptions.NoSuchKey:
+        logging.warning(f"{file_key} not found, reading {fallback_file_key}")
+        response = s3_client.get_object(Bucket=bucket, Key=fallback_file_key)
+        syllabus = json.loads(response['Body'].read())
+        return {field: [item.get(field) for item in syllabus] for field in fields}
+    # only the columns needed are decoded
+    return decode_columns(json.loads(response['Body'].read()), fields)
 
-    syllabus = json.loads(file_content)
+
+def fetch_timetable():
+    columns = fetch_columns(["b", "d", "k", "m", "h"])
 
     tmp_timetable = []
 
-    for item in syllabus:
+    for title, prof, category, level, term in zip(columns["b"], columns["d"], columns["k"], columns["m"], columns["h"]):
         # Check if 'm' is 0 and 'h' is '2s'
-        if item.get('m') == 0 and item.get('h') == '2s':
-            # Extract fields b, d, k
-            extracted_dict = {
-                'title': item['b'], 'prof': item['d'], 'category': item['k']}
-            tmp_timetable.append(extracted_dict)
+        if level == 0 and term == '2s':
+            tmp_timetable.append({'title': title, 'prof': prof, 'category': category})
 
     timetable = random.sample(tmp_timetable, 6)
     return timetable
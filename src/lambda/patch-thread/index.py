@@ -1,7 +1,7 @@
 from boto3.dynamodb.conditions import Attr
 import json
 from datetime import datetime
-from utils import JsonPayloadBuilder, resp_handler, table
+from utils import JsonPayloadBuilder, resp_handler, table, migrate_likes, set_like
 
 
 @resp_handler
@@ -28,68 +28,12 @@ def patch_thread(board_id, uid, thread_id, thread, action):
         )
     elif action == 'like':
         print("action like triggered")
-        # Add uid to the 'likes' list if it's not already there
-        table.update_item(
-            Key={
-                "board_id": board_id,
-                "thread_id": thread_id,
-            },
-            UpdateExpression='ADD likes :uid',
-            ConditionExpression='attribute_not_exists(likes) OR NOT contains(likes, :uid)',
-            ExpressionAttributeValues={
-                ':uid': {uid}
-            },
-        )
+        migrate_likes(board_id, thread_id)
+        set_like(board_id, thread_id, uid, True)
     elif action == 'dislike':
         print("action dislike triggered")
-        # Remove uid from the 'likes' list if it's already there
-
-        response = table.get_item(Key={
-            "board_id": board_id,
-            "thread_id": thread_id,
-        }
-        )
-        if 'Item' in response:
-            print(f"Current item: {response['Item']}")
-            current_likes = response['Item'].get('likes', set())
-            print(f"Current likes: {current_likes}")
-        else:
-            print("Item not found in DynamoDB")
-            return
-
-        print(f"Attempting to remove UID {uid} from likes")
-
-        current_likes = response['Item'].get('likes', set())
-        print("Current likes: ", current_likes)
-
-        # if only one like, remove the set entirely
-        if len(current_likes) == 1 and uid in current_likes:
-            table.update_item(
-                Key={
-                    "board_id": board_id,
-                    "thread_id": thread_id,
-                },
-                UpdateExpression='REMOVE likes',
-                ConditionExpression='attribute_exists(likes)',
-            )
-
-        # else, just delete the uid from set likes
-        else:
-            print(f"ELSE statement triggered. UID: {uid}")
-            try:
-                table.update_item(
-                    Key={
-                        "board_id": board_id,
-                        "thread_id": thread_id,
-                    },
-                    UpdateExpression='DELETE likes :uid',
-                    # ConditionExpression='attribute_exists(likes) AND contains(likes, :uid)',
-                    ExpressionAttributeValues={
-                        ':uid': {uid}
-                    },
-                )
-            except Exception as e:
-                print(f"Exception: {e}")
+        migrate_likes(board_id, thread_id)
+        set_like(board_id, thread_id, uid, False)
     # Increase comment_count by 1
     elif action == 'update_incr':
         print("action count increased triggered")
@@ -8,6 +8,8 @@ from decimal import Decimal
 # AWS DynamoDB Resources
 db = boto3.resource("dynamodb", region_name="ap-northeast-1")
 table = db.Table(os.getenv('TABLE_NAME'))
+# one item per like, type: {thread_id, uid}
+like_table = db.Table(os.getenv('LIKE_TABLE_NAME'))
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -66,3 +68,55 @@ def resp_handler(func):
             return api_response(500, resp)
 
     return handle
+
+
+def migrate_likes(board_id, thread_id):
+    """
+    Move the legacy likes set of a thread into like items and like_count, done once per thread on its next like
+    :return: None
+    """
+    key = {"board_id": board_id, "thread_id": thread_id}
+    likes = table.get_item(Key=key, ProjectionExpression='likes').get('Item', {}).get('likes')
+    if not likes:
+        return
+    with like_table.batch_writer(overwrite_by_pkeys=['thread_id', 'uid']) as writer:
+        for uid in likes:
+            writer.put_item(Item={"thread_id": thread_id, "uid": uid})
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET like_count = :count REMOVE likes',
+            ConditionExpression='attribute_exists(likes)',
+            ExpressionAttributeValues={':count': len(likes)},
+        )
+    except db.meta.client.exceptions.ConditionalCheckFailedException:
+        # migrated by a concurrent request
+        pass
+
+
+def set_like(board_id, thread_id, uid, liked):
+    """
+    Add or remove the like of a user and update like_count in one transaction, so the count never drifts
+    :param liked: True to like, False to remove the like
+    :return: bool, False if the user already liked, or did not like, the thread
+    """
+    like_key = {"thread_id": thread_id, "uid": uid}
+    if liked:
+        like_request = {'Put': {'TableName': like_table.name, 'Item': like_key,
+                                'ConditionExpression': 'attribute_not_exists(uid)'}}
+    else:
+        like_request = {'Delete': {'TableName': like_table.name, 'Key': like_key,
+                                   'ConditionExpression': 'attribute_exists(uid)'}}
+    count_request = {'Update': {
+        'TableName': table.name,
+        'Key': {"board_id": board_id, "thread_id": thread_id},
+        'UpdateExpression': 'ADD like_count :delta',
+        'ConditionExpression': 'attribute_exists(thread_id)',
+        'ExpressionAttributeValues': {':delta': 1 if liked else -1},
+    }}
+    try:
+        db.meta.client.transact_write_items(TransactItems=[like_request, count_request])
+    except db.meta.client.exceptions.TransactionCanceledException as e:
+        logging.info(f"Like of {uid} on {thread_id} unchanged: {e}")
+        return False
+    return True
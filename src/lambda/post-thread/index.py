@@ -36,8 +36,8 @@ def post_thread(board_id, thread, uid):
         "body": text,
         "uid": uid,
         "thread_id": thread_id,
-        "tag_id": thread["tag_id"],
-        "group_id": thread["group_id"],
+        "tag_id": thread.get("tag_id"),
+        "group_id": thread.get("group_id"),
         "univ_id": thread["univ_id"],
         "views": 0,
         "comment_count": 0,
@@ -45,7 +45,9 @@ def post_thread(board_id, thread, uid):
         "obj_key": object_key,
     }
 
-    table.put_item(Item=thread_item)
+    # tag_id and group_id are keys of TagIndex and GroupIndex, which reject null and empty values
+    table.put_item(Item={key: value for key, value in thread_item.items()
+                         if key not in ("tag_id", "group_id") or value})
 
     thread_item.pop('uid', None)
     thread_item["mod"] = True
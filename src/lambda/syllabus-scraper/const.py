@@ -43,47 +43,6 @@ school_name_map = {
     "GEC": {"jp": "グローバル", "en": "Global", "param": "9S2013"}
 }
 
-location_name_map = {
-    "61号館2階": "61-2F",
-    "61号館BF": "61-BF",
-    "Business Design & Management labo 61-2F": "61-2F Business Design & Management lab",
-    "foyer 50-301": "50-301",
-    "Seminar room 3 50-304": "50-304",
-    "255B教室": "61-255B",
-    "711教室": "51-711",
-    "５８-３Ｆ　社工演習室": "58-3F",
-    "801教室": "51-801",
-    "3-201(Center for Teaching,Learning, and Technology Active Learning)": "3-201",
-    "3-202(Center for Teaching,Learning, and Technology Active Learning)": "3-202",
-    "3-203(Center for Teaching,Learning, and Technology Active Learning)": "3-203",
-    "806共同利用研究室7": "14-806",
-    "504(コンピュータ教室)科学技術計算": "14-504",
-    "408(コンピュータ教室)": "16-408",
-    "6-318(博物館実習室)": "6-318",
-    "１４-Ｂ１０３教育学部図書館学実習室": "14-B103",
-    "14-810(院生指導室)": "14-810",
-    "６１-２５５Ｂ教室": "61-255B",
-    "14-806共同利用研究室7": "14-806",
-    "14-805共同利用研究室6": "14-805",
-    "14-807共同利用研究室8": "14-807",
-    "14-507共同利用研究室2": "14-507",
-    "14-506共同利用研究室1": "14-506",
-    "５１-７１１教室": "51-711",
-    "11-601　Computer Room 1": "11-601",
-    "11-602　Computer Room 2": "11-602",
-    "3-901 (SPSE PC Room)": "3-901",
-    "60-101(CSE Learning Commons)": "60-101",
-    "５１-８０１教室": "51-801",
-    "Seminar room 4 50-3011": "50-3011",
-    "Seminar room 5 50-3012": "50-3012",
-    "14-809(院生指導室)": "14-809",
-    "14-808(院生指導室)": "14-808",
-    "Seminar room 2 50-303": "50-303",
-    "drafting room": "57-1F",
-    "-": "undecided",
-    "Faculty Office": "Faculty Office"
-}
-
 user_agents = [
     "Mozilla/5.0 (Windows NT 6.2; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.90 Safari/537.36",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/78.0.3904.108 Safari/537.36",
@@ -111,131 +70,36 @@ header = {
     "User-Agent": random.choice(user_agents)
 }
 
-query = {
-    # used in course catalog page
-    "page_num": "//table[@class='t-btn']//table[@class='t-btn']//a/text()",
-    "course_list": "//table[@class='ct-vh']//tbody/tr",
-    "course_id": "td[3]/a[1]/@onclick",
-    # used in course detail page
-    "info_table": "//div[@id='cEdit']//div[1]//div[1]//div[1]//div[1]//div[1]//div[2]//table[1]//tbody[1]",
-    "title": "tr[2]/td[1]/div[1]/text()",
-    "instructor": "tr[3]/td[1]/text()",
-    "occurrence": "tr[4]/td[1]/text()",
-    "category": "tr[5]/td[1]/text()",
-    "min_year": "tr[5]/td[2]/text()",
-    "credit": "tr[5]/td[3]/text()",
-    "classroom": "tr[6]/td[1]/text()",
-    "campus": "tr[6]/td[2]/text()",
-    "lang": "tr[8]/td[1]/text()",
-    "modality": "tr[9]/td[1]/text()",
-    "code": "tr[10]/td[1]/text()",
-    "code_old": "tr[9]/td[1]/text()",
-    "level": "tr[14]/td[1]/text()",
-    "level_old": "tr[13]/td[1]/text()",
-    "type": "tr[14]/td[2]/text()",
-    "type_old": "tr[13]/td[2]/text()",
-    "text_table": "/html[1]/body[1]/form[1]/div[1]/div[2]/div[1]/div[1]/div[1]/div[1]/div[1]/div[1]/"
-                  "div[1]/div[2]/div[2]/div[1]/div[2]/div[1]/div[1]/div[1]/div[1]/div[2]/table[1]/tbody[1]/tr",
-    "row_name": "th[1]/text()",
-    "row_content": "td[1]"
-}
+# bump whenever the parsing logic changes, so that incremental crawls re-parse every course
+parser_version = 2
 
-eval_type_map = {
-    "Exam:": 0,
-    "Papers:": 1,
-    "Class Participation:": 2,
-    "Others:": 3
-}
+fingerprint_path = "fingerprint/"
 
-type_enum_map = {
-    "指定なし": -1,
-    "講義": 0,
-    "演習／ゼミ": 1,
-    "実習／実験／実技": 2,
-    "外国語": 3,
-    "オンデマンド": 4,
-    "論文": 5,
-    "研究指導": 6,
-    "実践／フィールドワーク／インターンシップ／ボランティア": 7,
-    "対面／オンデマンド": 8
-}
+# course id -> content hash of the last upload, and the ids changed by it
+manifest_path = "manifest/"
+delta_path = "delta/"
 
-level_enum_map = {
-    "指定なし": -1,
-    "初級レベル（入門・導入）": 0,
-    "中級レベル（発展・応用）": 1,
-    "上級レベル": 2,
-    "総仕上げ": 3,
-    "修士レベル": 4,
-    "博士レベル": 5
-}
+# the syllabus in columns, see syllabus.ColumnarEncoder
+columnar_path = "columnar/"
 
-term_enum_map = {
-    "spring semester": "0s",
-    "fall semester": "2s",
-    "spring quarter": "0q",
-    "summer quarter": "1q",
-    "fall quarter": "2q",
-    "winter quarter": "3q",
-    "full year": "f",
-    "spring": "0",
-    "summer": "1",
-    "fall": "2",
-    "winter": "3",
-    "an intensive course(spring)": "0i",
-    "an intensive course(fall)": "2i",
-    "spring term": "0t",
-    "summer term": "1t",
-    "fall term": "2t",
-    "winter term": "3t",
-    "spring term／summer term": "0t/1t",
-    "spring semester／fall semester": "0s/2s",
-    "fall term／winter term": "2t/3t",
-    "summer and fall semester": "1&2s",
-    "spring semester and summer": "0s&1",
-    "full year／fall semester": "f/2s",
-    "an intensive course(spring and fall)": "0i&3i"
-}
+# the search index merged from the columnar syllabus of every department, see syllabus.SearchIndexBuilder
+index_path = "index/"
+search_index_name = "search"
 
-weekday_enum_map = {
-    'Sun': 0,
-    'Mon': 1,
-    'Tues': 2,
-    'Wed': 3,
-    'Thur': 4,
-    'Fri': 5,
-    'Sat': 6
-}
+# pre-compressed copies of the syllabus files, type: {content encoding: sub path}
+compressed_paths = {"gzip": "gzip/", "br": "br/"}
 
-lang_enum_map = {
-    'N/A': -1,
-    'Japanese': 0,
-    'English': 1,
-    'German': 2,
-    'French': 3,
-    'Chinese': 4,
-    'Spanish': 5,
-    'Korean': 6,
-    'Russian': 7,
-    'Italian': 8,
-    'other': 9,
-    'Language Course': 9
-}
+# catalog pages scraped by one invocation of the planned batches, a school with more pages gets a batch of its own
+batch_pages = 12
 
-modality_enum_map = {
-    "【対面】": 0,
-    "【対面】ハイブリッド（対面回数半数以上）": 1,
-    "【非常時】ハイブリッド": 1,
-    "【オンライン】ハイブリッド（対面回数半数未満）": 1,
-    "【オンライン】フルオンデマンド": 2,
-    "【非常時】フルオンデマンド": 2,
-    "フルオンデマンド（コロナ）": 2,
-    "フルオンデマンド（既存）": 2,
-    "オンデマンド（曜日時限あり）": 3,
-    "オンデマンド": 3,
-    "【オンライン】リアルタイム配信": 4,
-    "【非常時】リアルタイム配信": 4,
-}
+# statuses of wsl.waseda.jp retried like connection errors, other errors fail at once
+retry_statuses = (429, 500, 502, 503, 504)
+
+# attempts of a page fetched by the async engine
+fetch_attempts = 3
+
+# part size of the multipart syllabus upload
+upload_chunk_size = 8 * 1024 * 1024
 
 cron_schedule = ["01-01", "02-01", "02-14", "02-24", "03-01", "03-04", "03-07", "03-10", "03-16", "03-18", "03-21",
                  "03-24", "03-27", "04-01", "04-03", "04-05", "04-08", "04-16", "04-20", "04-24", "04-26", "04-28",
@@ -1,32 +1,74 @@
-import urllib.request as requests
+import aiohttp
+import asyncio
+import logging
+import urllib3
+from concurrent.futures.thread import ThreadPoolExecutor
 from const import *
 from datetime import datetime
-from lxml import html
+from syllabus import index_course, parse_catalog, parse_course, parse_max_page
 from utils import *
 
 
 class SyllabusCrawler:
-    def __init__(self, school, worker=8):
+    def __init__(self, school, worker=8, incremental=False, engine="thread", parser_worker=4):
         """
         :param school: department name
-        :param task: tasks to execute
-        :param engine: "thread-only" | "hybrid",
-        :param worker: num of worker threads
+        :param worker: num of worker threads, or num of in-flight requests if engine is "async"
+        :param incremental: reuse the previous record of courses whose pages are unchanged
+        :param engine: "thread" | "async"
+        :param parser_worker: num of threads parsing pages if engine is "async"
         """
         if school not in school_name_map.keys():
             raise ValueError
+        if engine not in ("thread", "async"):
+            raise ValueError
         self.school = school
         self.worker = worker
+        self.engine = engine
+        self.parser_worker = parser_worker
+        self.incremental = incremental
+        # fingerprints of the pages scraped in this run, type: {course_id: fingerprint}
+        self.fingerprints = {}
+        # fingerprints and records of the previous run, only loaded in incremental mode
+        self.known_fingerprints = {}
+        self.previous = {}
         now = datetime.now()
         self.year = now.year
         if now.month < 3:
             self.year = self.year - 1
+        # keep-alive connections shared by all worker threads, one per worker at most
+        self.http = urllib3.PoolManager(
+            num_pools=1,
+            maxsize=worker,
+            block=True,
+            headers=header,
+            timeout=urllib3.Timeout(connect=5, read=30),
+            # error statuses are retried too, then raised so that a school never uploads a partial syllabus
+            retries=urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=retry_statuses,
+                                  raise_on_status=True)
+        )
+
+    def fetch(self, url):
+        """
+        Fetch a page through the connection pool
+        :param url: url of the page
+        :return: raw html
+        """
+        resp = self.http.request('GET', url)
+        if resp.status != 200:
+            raise urllib3.exceptions.HTTPError(f"HTTP {resp.status} on {url}")
+        return resp.data
 
     def execute(self):
         """
         Execute the crawler
-        :return: list of courses
+        :return: generator of courses, scraped while it is consumed
+                 (a list if engine is "async")
         """
+        if self.incremental:
+            self.load_previous()
+        if self.engine == "async":
+            return asyncio.run(self.execute_async())
         pages = self.get_max_page()
         course_pages = run_concurrently(
             self.scrape_catalog, range(pages), self.worker)
@@ -34,18 +76,72 @@ class SyllabusCrawler:
         results = run_concurrently(self.scrape_course, course_ids, self.worker)
         return results
 
+    async def execute_async(self):
+        """
+        Execute the crawler on an event loop, parsing pages in a small thread pool
+        :return: list of courses
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.worker)
+        connector = aiohttp.TCPConnector(limit=self.worker)
+        timeout = aiohttp.ClientTimeout(sock_connect=5, sock_read=30)
+
+        with ThreadPoolExecutor(max_workers=self.parser_worker) as parser:
+            async with aiohttp.ClientSession(headers=header, connector=connector, timeout=timeout) as session:
+                async def fetch(url):
+                    for attempt in range(fetch_attempts):
+                        try:
+                            async with semaphore, session.get(url) as resp:
+                                resp.raise_for_status()
+                                return await resp.read()
+                        except aiohttp.ClientResponseError as e:
+                            # e.g. 404 of a withdrawn course
+                            if e.status not in retry_statuses or attempt == fetch_attempts - 1:
+                                raise
+                        except (aiohttp.ClientError, asyncio.TimeoutError):
+                            if attempt == fetch_attempts - 1:
+                                raise
+                        # the worker slot is released while waiting
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+
+                async def scrape_course(course_id):
+                    body_en, body_jp = await asyncio.gather(
+                        fetch(build_url(lang='en', course_id=course_id)),
+                        fetch(build_url(lang='jp', course_id=course_id))
+                    )
+                    return await loop.run_in_executor(parser, self.extract_course, course_id, body_en, body_jp)
+
+                async def scrape_catalog(page):
+                    body = await fetch(build_url(dept=self.school, page=page + 1, lang='en', year=self.year))
+                    course_ids = await loop.run_in_executor(parser, parse_catalog, body)
+                    return await asyncio.gather(*(scrape_course(course_id) for course_id in course_ids))
+
+                body = await fetch(build_url(self.school, 1, 'en', year=self.year))
+                pages = parse_max_page(body)
+                results = await asyncio.gather(*(scrape_catalog(page) for page in range(pages)))
+        return [course for page in results for course in page]
+
+    def load_previous(self):
+        """
+        Load the fingerprint manifest and the syllabus uploaded by the previous run
+        :return: None
+        """
+        manifest = load_from_s3(build_key(self.school, fingerprint_path))
+        if not manifest or manifest.get("v") != parser_version:
+            logging.info(f"No usable fingerprint manifest for {self.school}, doing a full crawl")
+            return
+        syllabus = load_from_s3(build_key(self.school)) or []
+        self.previous = {course["a"]: course for course in syllabus}
+        self.known_fingerprints = manifest["courses"]
+        logging.info(f"Loaded {len(self.previous)} previous records of {self.school}")
+
     def get_max_page(self):
         """
         Get the max page number for a department
         :return: int
         """
-        url = build_url(self.school, 1, 'en')
-        body = requests.urlopen(url).read()
-        try:
-            last = html.fromstring(body).xpath(query["page_num"])[-1]
-        except IndexError:
-            return 1
-        return int(last)
+        body = self.fetch(build_url(self.school, 1, 'en', year=self.year))
+        return parse_max_page(body)
 
     def scrape_catalog(self, page):
         """
@@ -53,11 +149,8 @@ class SyllabusCrawler:
         :param page: page number (starts from 1)
         :return: list of course ids
         """
-        req = requests.Request(url=build_url(dept=self.school, page=page + 1, lang='en', year=self.year),
-                               headers=header)
-        resp = requests.urlopen(req).read()
-        clist = html.fromstring(resp).xpath(query["course_list"])
-        return [re.search(r"\w{28}", clist[i].xpath(query["course_id"])[0]).group(0) for i in range(1, len(clist))]
+        resp = self.fetch(build_url(dept=self.school, page=page + 1, lang='en', year=self.year))
+        return parse_catalog(resp)
 
     def scrape_course(self, course_id):
         """
@@ -89,34 +182,34 @@ class SyllabusCrawler:
                 "r": 'string', #modality
             }
         """
-        req_en = requests.Request(url=build_url(
-            lang='en', course_id=course_id), headers=header)
-        req_jp = requests.Request(url=build_url(
-            lang='jp', course_id=course_id), headers=header)
-        parsed_en = html.fromstring(requests.urlopen(req_en).read())
-        parsed_jp = html.fromstring(requests.urlopen(req_jp).read())
-        info_en = parsed_en.xpath(query["info_table"])[0]
-        info_jp = parsed_jp.xpath(query["info_table"])[0]
-        # TODO optimize code structure
-        locations = scrape_info(info_en, 'classroom', parse_location)
-        periods = scrape_info(info_en, 'occurrence', parse_period)
-        return {
-            "a": course_id,
-            "b": scrape_info(info_en, 'title', to_half_width),
-            "c": scrape_info(info_jp, 'title', to_half_width),
-            "d": scrape_info(info_en, 'instructor', to_half_width),
-            "e": scrape_info(info_jp, 'instructor', to_half_width),
-            "f": scrape_info(info_en, 'lang', parse_lang),
-            "g": scrape_info(info_jp, 'type', to_enum(type_enum_map)),
-            "h": scrape_info(info_en, 'occurrence', parse_term),
-            "i": merge_period_location(periods, locations),
-            "j": scrape_info(info_en, 'min_year', parse_min_year),
-            "k": scrape_info(info_en, 'category', to_half_width),
-            "l": scrape_info(info_en, 'credit', parse_credit),
-            "m": scrape_info(info_jp, 'level', to_enum(level_enum_map)),
-            "n": get_eval_criteria(parsed_en),
-            "o": scrape_info(info_jp, 'code', None),
-            "p": scrape_text(parsed_en, "Subtitle", to_half_width),
-            "q": scrape_info(info_jp, 'category', to_half_width),
-            "r": scrape_info(info_jp, 'modality', to_enum(modality_enum_map)),
-        }
+        body_en = self.fetch(build_url(lang='en', course_id=course_id))
+        body_jp = self.fetch(build_url(lang='jp', course_id=course_id))
+        return self.extract_course(course_id, body_en, body_jp)
+
+    def extract_course(self, course_id, body_en, body_jp):
+        """
+        Get the detail of a course from its raw pages, reusing the previous record if they are unchanged
+        :param course_id:
+        :param body_en: raw html of the english page
+        :param body_jp: raw html of the japanese page
+        :return: dict, see scrape_course
+        """
+        fingerprint = get_fingerprint(body_en, body_jp)
+        self.fingerprints[course_id] = fingerprint
+        if self.known_fingerprints.get(course_id) == fingerprint and course_id in self.previous:
+            return self.previous[course_id]
+        return parse_course(course_id, *index_course(body_en, body_jp)).to_compact()
+
+
+def count_pages(schools, worker=8):
+    """
+    Get the num of catalog pages of departments concurrently
+    :param schools: list of department names
+    :param worker: num of worker threads
+    :return: dict := {school: num of pages}
+    """
+
+    def count(school):
+        return school, SyllabusCrawler(school, worker=1).get_max_page()
+
+    return dict(run_concurrently(count, schools, worker))
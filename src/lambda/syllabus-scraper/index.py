@@ -1,6 +1,9 @@
 import logging
-from crawler import SyllabusCrawler
-from utils import upload_to_s3
+from const import columnar_path, school_name_map
+from crawler import SyllabusCrawler, count_pages
+from syllabus import ColumnarEncoder
+from utils import CompressedVariants, build_key, load_manifest, upload_fingerprints, upload_json, upload_manifest, \
+    plan_batches, upload_search_index, upload_to_s3, upload_variants
 
 
 def handler(event, context):
@@ -10,12 +13,33 @@ def handler(event, context):
     :param context:
     :return:
     """
+    if event.get("task") == "plan":
+        pages = count_pages(event.get("schools", list(school_name_map)))
+        logging.info(f"Catalog pages: {pages}")
+        return {"pages": pages, "batches": [{"schools": schools} for schools in plan_batches(pages)]}
+    if event.get("task") == "index":
+        logging.info("Building the search index")
+        upload_search_index()
+        return None
     schools = event["schools"]
+    incremental = event.get("incremental", True)
+    engine = event.get("engine", "thread")
+    worker = event.get("worker", 32)
     for school in schools:
         logging.info(f"Started scraping school: {school}")
-        syllabus_info = SyllabusCrawler(school=school, worker=32).execute()
+        crawler = SyllabusCrawler(school=school, worker=worker, incremental=incremental, engine=engine)
+        syllabus_info = crawler.execute()
+        manifest = load_manifest(school)
+        columns = ColumnarEncoder()
+        variants = CompressedVariants()
+        logging.info(f"Uploading {school}.json to S3 while scraping")
+        upload_to_s3(columns.collect(syllabus_info), school, manifest=manifest, variants=variants)
         logging.info(f"Finished scraping school: {school}")
-        logging.info(f"Uploading {school}.json to S3 ")
-        upload_to_s3(syllabus_info, school)
+        upload_variants(variants, school)
+        columnar = columns.to_json()
+        upload_json(columnar, build_key(school, columnar_path))
+        upload_variants(CompressedVariants.from_json(columnar), school, columnar_path)
+        upload_fingerprints(crawler.fingerprints, school)
+        upload_manifest(manifest, school)
         logging.info(f"Successfully uploaded {school}.json")
     return None
@@ -1,38 +1,22 @@
 import boto3
+import brotli
+import hashlib
+import io
 import itertools
 import json
 import logging
 import os
-import re
-import unicodedata
+import zlib
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
-from concurrent.futures import as_completed
+from concurrent.futures import FIRST_COMPLETED, wait
 from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import datetime
+from syllabus import SearchIndexBuilder
 
 from const import *
 
 
-def scrape_info(parsed, key, fn):
-    """
-    Extract info from parsed and let it processed by fn
-    :param parsed: parsed html section
-    :param key: category of info
-    :param fn: function used to transform data
-    :return: scraped information
-    """
-    section = parsed.xpath(query[key])
-    # special cases if modality not present
-    if (key == "code" or key == "level" or key == "type") and scrape_info(parsed, 'modality',
-                                                                          to_enum(modality_enum_map)) == -1:
-        section = parsed.xpath(query[f"{key}_old"])
-    if section:
-        if not fn:
-            return section[0]
-        return fn(section[0])
-    return ""
-
-
 def build_url(dept=None, page=1, lang="en", course_id=None, year=2021):
     """
     Constructs the url of course catalog page or course detail page(if course id is present)
@@ -50,304 +34,343 @@ def build_url(dept=None, page=1, lang="en", course_id=None, year=2021):
            f"&pLng={lang} "
 
 
-def to_half_width(s):
+def upload_to_s3(syllabus, school, compress=False, manifest=None, variants=None):
     """
-    Converts zenkaku to hankaku
-    :param s:
-    :return:
+    Upload the syllabus info of the department to s3.
+    Courses are encoded while they are read by a multipart upload, so memory usage does not grow with
+    the size of the department and the upload overlaps with scraping.
+    :param syllabus: iterator of course info
+    :param school: abbr of the department. e.g. "PSE"
+    :param compress: gzip the json and set the Content-Encoding accordingly
+    :param manifest: SyllabusManifest recording the content hash of every uploaded course
+    :param variants: CompressedVariants fed with the uncompressed json, see upload_variants
+    :return: None
     """
-    if not s:
-        return ""
-    return unicodedata.normalize('NFKC', s)
-
-
-def remove_format_chars(line):
-    cleaned_line = re.sub(r'[\n\r\t]', ' ', line)
-    return cleaned_line
+    syllabus_object = get_s3_object(build_key(school))
+    extra_args = {
+        'ACL': 'private',
+        'ContentType': 'application/json; charset=utf-8',
+        'CacheControl': 'public, max-age=2592000, must-revalidate',
+        'Expires': get_expire_date()
+    }
+    if compress:
+        extra_args['ContentEncoding'] = 'gzip'
+    if manifest:
+        extra_args['Metadata'] = {'generation': str(manifest.generation)}
+    syllabus_object.upload_fileobj(
+        JsonArrayStream(syllabus, compress, tap=manifest.add if manifest else None, copy=variants),
+        ExtraArgs=extra_args,
+        Config=TransferConfig(multipart_chunksize=upload_chunk_size)
+    )
 
 
-def get_eval_criteria(parsed):
+class CompressedVariants:
     """
-    Get the evaluation criteria from course detail page
-    :return: array :=
-        [{
-            "t": 'enum' # type
-            "p": 'int' # percent
-            "c": 'string' #criteria
-        }]
+    Gzip and brotli encodings of a stream at their maximum levels, built while the stream is written
     """
-    table = get_syllabus_texts(parsed, "Evaluation")
-    if table is None:
-        return []
-    evals = []
-    rows = table.xpath('table//tr')
-    # Case 1: the only row is the table header
-    if len(rows) < 2:
-        return []
-    # Case 2: 2 or more rows
-    for r in rows[1:]:
-        elem = r.getchildren()
-        kind = elem[0].text_content()
-        percent = elem[1].text.strip()[:-1] or -1
-        try:
-            percent = int(percent)
-        except ValueError:
-            logging.warning(f"Unable to parse percent: {percent}")
-        criteria = to_half_width(elem[2].text_content())
-        cleaned_criteria = remove_format_chars(criteria)
-        evals.append({
-            "t": to_enum(eval_type_map)(kind),
-            "p": percent,
-            "c": cleaned_criteria
-        })
-    return evals
-
-
-def scrape_text(parsed, row_name, fn):
-    element = get_syllabus_texts(parsed, row_name)
-    if element is not None:
-        return fn(element.text)
-    return ""
-
-
-def get_syllabus_texts(course_html, row_name=None):
+
+    def __init__(self):
+        self.gzip_compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS, 9)
+        self.br_compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=11)
+        # type: {content encoding: compressed bytes}
+        self.encodings = {"gzip": bytearray(), "br": bytearray()}
+
+    def write(self, data):
+        self.encodings["gzip"] += self.gzip_compressor.compress(data)
+        self.encodings["br"] += self.br_compressor.process(data)
+
+    def close(self):
+        self.encodings["gzip"] += self.gzip_compressor.flush()
+        self.encodings["br"] += self.br_compressor.finish()
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        :param data: json serializable object
+        :return: CompressedVariants of the encoded object
+        """
+        variants = cls()
+        variants.write(json.dumps(data).encode('UTF-8'))
+        variants.close()
+        return variants
+
+
+def upload_variants(variants, school, path=""):
     """
-    Get all the "Syllabus Information" in course details page
-    :param row_name: the name of which row to extract
-    :param course_html: parsed html
-    :return: dict:=
-        {
-            row1_name: row1_content,
-            ...
-        }
-        or an Element if row_name is specified
-        or None if nothing matched
+    Upload every encoding of a syllabus file to s3 under compressed_paths, e.g. syllabus/br/PSE.json,
+    with the Content-Encoding set so that it is served as the original json
+    :param variants: closed CompressedVariants
+    :param school: abbr of the department. e.g. "PSE"
+    :param path: sub path of the original file, e.g. "columnar/"
+    :return: None
     """
-    if course_html is None:
-        return None
-    rows = course_html.xpath(query["text_table"])
-    row_names = [(row.xpath(query["row_name"]) or [""])[0] for row in rows]
-    for i in range(len(row_names)):
-        if row_name == row_names[i]:
-            content = rows[i].xpath(query["row_content"])
-            if content:
-                return content[0]
-            return None
-    return None
-
-
-def merge_period_location(periods, locations):
+    for encoding, body in variants.encodings.items():
+        get_s3_object(build_key(school, compressed_paths[encoding] + path)).put(
+            ACL='private',
+            Body=bytes(body),
+            ContentType='application/json; charset=utf-8',
+            ContentEncoding=encoding,
+            CacheControl='public, max-age=2592000, must-revalidate',
+            Expires=get_expire_date()
+        )
+
+
+class JsonArrayStream(io.RawIOBase):
     """
-    Join location with period
-    :param periods: list
-    :param locations: list
-    :return: array of dict
+    Non-seekable file-like object encoding an iterator of items into a json array on the fly
     """
-    occurrences = []
-    # Case 1: multiple periods but only one location
-    if len(locations) == 1:
-        for p in periods:
-            p["l"] = locations[0]
-        return periods
-    # Case 2: More no. of periods than no. of locations
-    zipped = list(itertools.zip_longest(periods, locations))
-    for (p, loc) in zipped:
-        if p is None:
-            logging.error(f"Unexpected None in periods. loc={loc}")
-            continue
 
-        if loc is not None:
-            p["l"] = loc
-        else:
-            logging.warning(
-                f"Missing location for period {p}. Assigning default value.")
-            p["l"] = "undecided"
+    def __init__(self, items, compress=False, tap=None, copy=None):
+        """
+        :param items: iterator of json serializable items
+        :param compress: gzip the encoded bytes
+        :param tap: function called with each item and its encoded bytes
+        :param copy: file-like object also written with the uncompressed bytes, and closed at the end
+        """
+        super().__init__()
+        self.tap = tap
+        self.copy = copy
+        self.chunks = self.encode(items)
+        self.compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+        self.buffer = bytearray()
+        self.finished = False
+
+    def encode(self, items):
+        # same output as json.dumps(list(items))
+        yield b"["
+        for i, item in enumerate(items):
+            if i:
+                yield b", "
+            encoded = json.dumps(item).encode('UTF-8')
+            if self.tap:
+                self.tap(item, encoded)
+            yield encoded
+        yield b"]"
+
+    def readable(self):
+        return True
+
+    def fill(self, size):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.finished = True
+                if self.compressor:
+                    self.buffer += self.compressor.flush()
+                if self.copy:
+                    self.copy.close()
+                continue
+            if self.copy:
+                self.copy.write(chunk)
+            if self.compressor:
+                self.buffer += self.compressor.compress(chunk)
+            else:
+                self.buffer += chunk
 
-        occurrences.append(p)
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        self.fill(size)
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
 
-    # Case 3: Logging error for unusual scenarios
-    if not occurrences:
-        logging.error(
-            f"merge_period_location resulted in no occurrences for input periods={periods}, locations={locations}")
 
-    return occurrences
+def upload_fingerprints(fingerprints, school):
+    """
+    Upload the page fingerprints of the department to s3, used by the next incremental crawl
+    :param fingerprints: dict of course id to page fingerprint
+    :param school: abbr of the department. e.g. "PSE"
+    :return: dict, response of s3 put
+    """
+    return upload_json({"v": parser_version, "courses": fingerprints}, build_key(school, fingerprint_path))
 
 
-def parse_min_year(eligible_year):
+class SyllabusManifest:
     """
-    Parse minimum eligible year
-    :param eligible_year: string
-    :return: int
+    Content hash of every course of a department, and the courses changed since the previous generation.
+    Published next to the syllabus so that consumers can fetch only what changed.
     """
-    if not eligible_year:
-        return -1
-    if eligible_year[0].isdigit():
-        return int(eligible_year[0])
-    return -1
-
 
-def rename_location(loc):
-    if re.fullmatch(r"^[\d]+-[\dA-Z-]+$", loc):
-        return loc
-    elif loc in location_name_map.keys():
-        return location_name_map[loc]
-    else:
-        logging.warning(f"Unable to parse location: {loc}")
-        return to_half_width(loc)
+    def __init__(self, previous=None):
+        """
+        :param previous: the manifest of the previous upload, see to_json
+        """
+        previous = previous or {}
+        self.generation = previous.get("generation", 0) + 1
+        self.previous = previous.get("courses", {})
+        # type: {course_id: content_hash}
+        self.courses = {}
+        self.added = []
+        self.changed = []
+
+    def add(self, course, encoded):
+        """
+        Record a course as it is uploaded
+        :param course: course info
+        :param encoded: the course encoded in the syllabus json
+        :return: None
+        """
+        content_hash = hashlib.md5(encoded).hexdigest()[:16]
+        self.courses[course["a"]] = content_hash
+        previous_hash = self.previous.get(course["a"])
+        if previous_hash is None:
+            self.added.append(course["a"])
+        elif previous_hash != content_hash:
+            self.changed.append(course["a"])
+
+    def to_json(self):
+        return {"generation": self.generation, "courses": self.courses}
+
+    def get_delta(self):
+        """
+        :return: dict := {
+            "from": previous generation,
+            "to": generation,
+            "added": [course_id],
+            "changed": [course_id],
+            "removed": [course_id]
+        }
+        """
+        return {
+            "from": self.generation - 1,
+            "to": self.generation,
+            "added": self.added,
+            "changed": self.changed,
+            "removed": [course_id for course_id in self.previous if course_id not in self.courses]
+        }
 
 
-def parse_location(loc):
+def load_manifest(school):
     """
-    Parse a series of locations
-    :param loc: string
-    :return: list
+    :param school: abbr of the department. e.g. "PSE"
+    :return: SyllabusManifest continuing the last published generation
     """
-    # Case 1: no location
-    if loc.isspace():
-        return ["undecided"]
-    # Case 2: a single location
-    if len(loc.split('／')) == 1:
-        return [rename_location(loc)]
-    # Case 3: multiple 'period:location' separated by /
-    rooms = []
-    locations = loc.split('／')
-    for l in locations:
-        matches = re.findall(r'0(\d):(.*)', l)
-        for match in matches:
-            count, classroom = int(match[0]) - 1, match[1]
-            classroom = rename_location(classroom)
-            if count >= len(rooms):
-                rooms.append([classroom])
-            else:
-                rooms[count].append(classroom)
-    return [room for sublist in rooms for room in sublist]
+    return SyllabusManifest(load_from_s3(build_key(school, manifest_path)))
 
 
-def parse_lang(lang):
-    if lang == "N/A":
-        return [-1]
-    langs = lang.split('/')
-    lang_list = [to_enum(lang_enum_map)(l) for l in langs]
-    return lang_list
+def upload_manifest(manifest, school):
+    """
+    Upload the delta since the previous generation, then the manifest itself,
+    so a consumer reading the manifest of a generation always finds the delta leading to it.
+    The delta is skipped on the first generation, as everything would be added.
+    :param manifest: SyllabusManifest of the uploaded syllabus
+    :param school: abbr of the department. e.g. "PSE"
+    :return: None
+    """
+    if manifest.generation > 1:
+        upload_json(manifest.get_delta(), build_key(school, delta_path))
+    upload_json(manifest.to_json(), build_key(school, manifest_path))
 
 
-def parse_term(schedule):
+def upload_search_index():
     """
-    Parse the term from string 'term  day/period'
-    :param schedule: string
-    :return: string(encoded_term)
+    Merge the columnar syllabus of every department into one search index, and upload it with its compressed copies
+    :return: None
     """
-    try:
-        (term, _) = schedule.split(u'\xa0\xa0', 1)
-    except ValueError:
-        logging.warning(f"Unable to parse term from '{schedule}'")
-        return "undecided"
-    if term not in term_enum_map.keys():
-        logging.error(f"Unknown term '{term}'")
-        return ""
-    return to_enum(term_enum_map)(term)
+    builder = SearchIndexBuilder()
+    for school in school_name_map:
+        columnar = load_from_s3(build_key(school, columnar_path))
+        if columnar is None:
+            logging.warning(f"No columnar syllabus of {school}, skipped in the search index")
+            continue
+        builder.add_school(school, columnar)
+    index = builder.to_json()
+    upload_json(index, build_key(search_index_name, index_path))
+    upload_variants(CompressedVariants.from_json(index), search_index_name, index_path)
+
 
+def upload_json(data, key):
+    return get_s3_object(key).put(
+        ACL='private',
+        Body=json.dumps(data).encode('UTF-8'),
+        ContentType='application/json; charset=utf-8'
+    )
 
-def parse_period(schedule):
+
+def load_from_s3(key):
     """
-    Extract day and period from raw data
-    :param schedule: string
-    :return: term and occurrence(list)
+    Load a json object from the syllabus bucket
+    :param key: object key
+    :return: parsed json, or None if the object does not exist
     """
-    # TODO optimize code structure
+    s3_object = get_s3_object(key)
     try:
-        (_, occ) = schedule.split(u'\xa0\xa0', 1)
-    except ValueError:
-        logging.warning(f"Unable to parse period: {schedule}")
-        return []
-    if occ == "othersothers":
-        return [{"d": -1, "p": -1}]
-    if occ == "othersOn demand":
-        return [{"d": -1, "p": 0}]
-    occ_matches = re.finditer(
-        r'(Mon|Tues|Wed|Thur|Fri|Sat|Sun)\.(\d-\d|\d|On demand)', occ)
-    occurrences = []
-    for match in occ_matches:
-        day, period = match.group(1), match.group(2)
-        day = to_enum(weekday_enum_map)(day)
-        if period is None:
-            period = -1
-        elif period == "On demand":
-            period = 0
-        elif period.isdigit():
-            period = int(period)
-        else:
-            p1, p2 = period.split('-', 1)
-            period = int(p1) * 10 + int(p2)
-        occurrences.append({"d": day, "p": period})
-    return occurrences
-
+        body = s3_object.get()["Body"].read()
+    except s3_object.meta.client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
 
-def parse_credit(credit):
-    if credit.isdigit():
-        return int(credit)
-    return -1
 
+def get_s3_object(key):
+    s3 = boto3.resource('s3', region_name="ap-northeast-1",
+                        verify=False, config=Config(signature_version='s3v4'))
+    return s3.Object(os.getenv('BUCKET_NAME'), key)
 
-def to_enum(enum_map):
-    def map_to_int(data):
-        if not data:
-            return -1
-        if data == u'\xa0':
-            return -1
-        try:
-            return enum_map[data]
-        except KeyError:
-            logging.warning(f"Unable to map '{data}' to integer")
-            return -1
 
-    return map_to_int
+def build_key(school, path=""):
+    """
+    Constructs the object key of a syllabus file in s3
+    :param school: abbr of the department. e.g. "PSE"
+    :param path: sub path under the syllabus path, e.g. "fingerprint/"
+    :return: str
+    """
+    return os.getenv('OBJECT_PATH') + path + school + '.json'
 
 
-def upload_to_s3(syllabus, school):
+def get_fingerprint(*pages):
     """
-    Upload the syllabus info of the department to s3
-    :param syllabus: iterator of course info
-    :param school: abbr of the department. e.g. "PSE"
-    :return: dict :=
-        {
-            'Expiration': 'string',
-            'ETag': 'string',
-            'ServerSideEncryption': 'AES256'|'aws:kms',
-            'VersionId': 'string',
-            'SSECustomerAlgorithm': 'string',
-            'SSECustomerKeyMD5': 'string',
-            'SSEKMSKeyId': 'string',
-            'SSEKMSEncryptionContext': 'string',
-            'RequestCharged': 'requester'
-        }
+    Compute the fingerprint of raw pages, used to detect unchanged courses
+    :param pages: raw html bodies
+    :return: str
     """
-    s3 = boto3.resource('s3', region_name="ap-northeast-1",
-                        verify=False, config=Config(signature_version='s3v4'))
-    syllabus_object = s3.Object(
-        os.getenv('BUCKET_NAME'), os.getenv('OBJECT_PATH') + school + '.json')
-    body = bytes(json.dumps(list(syllabus)).encode('UTF-8'))
-    resp = syllabus_object.put(
-        ACL='private',
-        Body=body,
-        ContentType='application/json; charset=utf-8',
-        CacheControl='public, max-age=2592000, must-revalidate',
-        Expires=get_expire_date()
-    )
-    return resp
+    digest = hashlib.md5()
+    for page in pages:
+        digest.update(page)
+    return digest.hexdigest()
 
 
-def run_concurrently(func, tasks, n):
+def run_concurrently(func, tasks, n, backlog=2):
     """
-    Run tasks using multiple threads
+    Run tasks using multiple threads, yielding each result as soon as it is ready.
+    Tasks are pulled lazily so that at most n * backlog of them are in flight at once,
+    which lets the tasks themselves be a stream, e.g. the results of another run_concurrently.
     :param func: function to run, type: a -> b
-    :param tasks: list of tasks to perform, type: [a]
+    :param tasks: iterable of tasks to perform, type: [a]
     :param n: number of worker threads
+    :param backlog: max number of in-flight tasks per worker thread
     :return: generator of results, type: [b]
     """
+    tasks = iter(tasks)
     with ThreadPoolExecutor(max_workers=n) as executor:
-        wait_list = [executor.submit(func, t) for t in tasks]
-    return (page.result() for page in as_completed(wait_list))
+        pending = {executor.submit(func, t) for t in itertools.islice(tasks, n * backlog)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending.update(executor.submit(func, t) for t in itertools.islice(tasks, len(done)))
+            for future in done:
+                yield future.result()
+
+
+def plan_batches(pages, max_pages=batch_pages):
+    """
+    Pack departments into batches of at most max_pages catalog pages.
+    Departments are taken from the largest and each goes to the first batch it fits in,
+    a department over max_pages gets a batch of its own.
+    :param pages: dict := {school: num of catalog pages}
+    :param max_pages: num of pages a batch is sized for
+    :return: list of lists of schools, type: [[str]]
+    """
+    batches = []
+    for school in sorted(pages, key=pages.get, reverse=True):
+        fit = next((b for b in batches if b[0] + pages[school] <= max_pages), None)
+        if fit is None:
+            batches.append([pages[school], [school]])
+        else:
+            fit[0] += pages[school]
+            fit[1].append(school)
+    return [schools for _, schools in batches]
 
 
 def get_expire_date():
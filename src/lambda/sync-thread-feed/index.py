@@ -0,0 +1,22 @@
+from utils import deserialize, get_feed_keys, is_volatile_change, update_feed
+
+
+def handler(event, context):
+    # changes of every feed in the batch, type: {feed_key: {thread_id: thread or None}}
+    changes = {}
+    for record in event['Records']:
+        old_thread = deserialize(record['dynamodb'].get('OldImage', {}))
+        new_thread = deserialize(record['dynamodb'].get('NewImage', {}))
+        # e.g. a view, which would otherwise rewrite two whole feeds
+        if is_volatile_change(old_thread, new_thread):
+            continue
+        thread_id = deserialize(record['dynamodb']['Keys'])['thread_id']
+        new_keys = get_feed_keys(new_thread)
+        for feed_key in get_feed_keys(old_thread):
+            if feed_key not in new_keys:
+                changes.setdefault(feed_key, {})[thread_id] = None
+        for feed_key in new_keys:
+            changes.setdefault(feed_key, {})[thread_id] = new_thread
+
+    for feed_key, feed_changes in changes.items():
+        update_feed(feed_key, feed_changes)
@@ -0,0 +1,123 @@
+import boto3
+import logging
+import os
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+db = boto3.resource("dynamodb", region_name="ap-northeast-1")
+table = db.Table(os.getenv('TABLE_NAME'))
+feed_table = db.Table(os.getenv('FEED_TABLE_NAME'))
+
+# num of latest threads kept in a feed, the first page of get-all-threads is served from it
+feed_size = 30
+
+# attempts to write a feed changed concurrently by another invocation
+max_retries = 5
+
+# attributes updated on every view, their changes alone do not rewrite the feeds.
+# The feed shows them as of the last other change of the thread
+volatile_keys = {'views', 'new_comment'}
+
+deserializer = TypeDeserializer()
+
+
+def deserialize(image):
+    """
+    :param image: item of a stream record in dynamodb json
+    :return: dict
+    """
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
+
+
+def is_volatile_change(old_thread, new_thread):
+    """
+    :param old_thread: thread item before the change, empty if it was created
+    :param new_thread: thread item after the change, empty if it was deleted
+    :return: True if only volatile_keys changed
+    """
+    if not old_thread or not new_thread:
+        return False
+    changed = {key for key in old_thread.keys() | new_thread.keys() if old_thread.get(key) != new_thread.get(key)}
+    return changed <= volatile_keys
+
+
+def get_feed_keys(thread):
+    """
+    :param thread: thread item
+    :return: list of the keys of the feeds listing the thread, e.g. ["board#1", "univ#1"]
+    """
+    keys = []
+    if thread.get('board_id'):
+        keys.append(f"board#{thread['board_id']}")
+    if thread.get('univ_id'):
+        keys.append(f"univ#{thread['univ_id']}")
+    return keys
+
+
+def query_feed(feed_key):
+    """
+    Read the latest threads of a feed from the thread table.
+    Univ feeds are read from a GSI, which is only eventually consistent, so the changes being applied must be
+    applied to the result again.
+    :param feed_key: see get_feed_keys
+    :return: list of threads, newest first
+    """
+    kind, value = feed_key.split('#', 1)
+    if kind == 'board':
+        query = {'KeyConditionExpression': Key("board_id").eq(value), 'ConsistentRead': True}
+    else:
+        query = {'IndexName': 'UnivIDbyThreadIDIndex', 'KeyConditionExpression': Key("univ_id").eq(value)}
+    return table.query(Limit=feed_size, ScanIndexForward=False, **query)['Items']
+
+
+def apply_changes(threads, changes):
+    """
+    :param threads: latest threads of a feed, newest first
+    :param changes: dict := {thread_id: new thread, or None if it left the feed}
+    :return: list of threads, newest first
+    """
+    by_id = {thread['thread_id']: thread for thread in threads}
+    # a changed thread older than a full feed does not belong to it
+    oldest = threads[-1]['thread_id'] if len(threads) >= feed_size else ''
+    for thread_id, thread in changes.items():
+        if thread is None:
+            by_id.pop(thread_id, None)
+        elif thread_id in by_id or thread_id > oldest:
+            by_id[thread_id] = thread
+    return sorted(by_id.values(), key=lambda thread: thread['thread_id'], reverse=True)[:feed_size]
+
+
+def update_feed(feed_key, changes):
+    """
+    Apply the changes of threads to a feed, with a version check against concurrent invocations
+    :param feed_key: see get_feed_keys
+    :param changes: see apply_changes
+    :return: None
+    """
+    for _ in range(max_retries):
+        item = feed_table.get_item(Key={'feed_key': feed_key}, ConsistentRead=True).get('Item')
+        if item is None:
+            threads = apply_changes(query_feed(feed_key), changes)
+            condition = {'ConditionExpression': 'attribute_not_exists(feed_key)'}
+            version = 0
+        else:
+            threads = apply_changes(item['threads'], changes)
+            if threads == item['threads']:
+                return
+            # a removal from a full feed leaves a gap only the table can fill
+            if len(threads) < feed_size <= len(item['threads']):
+                threads = apply_changes(query_feed(feed_key), changes)
+            condition = {
+                'ConditionExpression': '#version = :version',
+                'ExpressionAttributeNames': {'#version': 'version'},
+                'ExpressionAttributeValues': {':version': item['version']},
+            }
+            version = item['version']
+        try:
+            feed_table.put_item(Item={'feed_key': feed_key, 'threads': threads, 'version': version + 1}, **condition)
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    logging.error(f"Fail update feed {feed_key} after {max_retries} attempts")
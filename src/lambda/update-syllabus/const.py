@@ -1,18 +1,22 @@
-s3_to_dynamo = {
-    "a": 'id',
-    "b": 'title',
-    "c": 'title_jp',
-    "d": 'instructor',
-    "e": 'instructor_jp',
-    "f": 'lang',
-    "g": 'type',
-    "h": 'term',
-    "i": 'occurrences',
-    "j": 'min_year',
-    "k": 'category',
-    "l": 'credit', 
-    "m": 'level',
-    "n": 'eval',
-    "o": 'code',
-    "p": 'subtitle'
-}
+# max num of requests in a BatchWriteItem call
+batch_size = 25
+
+# num of threads writing batches concurrently
+write_worker = 4
+
+# retries of the unprocessed items of a batch, the wait doubles each time
+max_retries = 8
+backoff_base = 0.1
+backoff_cap = 5
+
+# deletes are skipped if a new version drops more than this ratio of the courses, e.g. after a failed scrape
+max_removed_ratio = 0.5
+
+# bytes of the hash kept per field of the old courses
+digest_size = 8
+
+# num of chars read at a time when streaming a syllabus json
+read_chunk_size = 64 * 1024
+
+# separator of the composite keys of the secondary indexes, e.g. "SILS#2s"
+index_separator = "#"
@@ -1,77 +1,120 @@
+import codecs
 import json
 import boto3
 import logging
 import os
-from boto3.s3.transfer import S3Transfer
-from const import *
 from utils import *
 
 
 s3 = boto3.client('s3')
-s3r = boto3.resource('s3')
-transfesr = S3Transfer(s3)
 
 dynamodb = boto3.resource('dynamodb')
 table    = dynamodb.Table(os.getenv('TABLE_NAME'))
-    
-    
-def compare_syllabus(now_name,old_name,school):
-    old_dict = {}
-    with open(old_name) as old_file:
-        old_syllabus = json.load(old_file)
-    with open(now_name) as now_file:
-        new_syllabus = json.load(now_file)
-    
-    #store every old item in dict
-    for i in range(0,len(old_syllabus)):
-        cs = Course(old_syllabus[i])
-        old_dict[cs.id] = cs
-        
-    print(len(old_syllabus))
-    
-    #compare old and new syllabus
-    for new_item in new_syllabus:
-        new_cs = Course(new_item)
-        match_id = new_cs.id
-        if(match_id in old_dict):
-            if(old_dict[match_id].data != new_cs.data):
-                update_course(new_cs,table,school)
+
+
+def get_latest_versions(bucket,key,n=2):
+    """
+    List the latest versions of an object without downloading them
+    :param bucket: bucket name
+    :param key: object key
+    :param n: num of versions
+    :return: list of versions, newest first
+    """
+    versions = []
+    paginator = s3.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket, Prefix=key):
+        #the prefix also matches longer keys, e.g. syllabus/SILS.json.gz
+        versions += [version for version in page.get('Versions', []) if version['Key'] == key]
+        if len(versions) >= n:
+            break
+    return versions[:n]
+
+
+def open_version(bucket,key,version):
+    """
+    Stream a version of the syllabus as text, it is downloaded once and never saved to disk
+    :return: text file object
+    """
+    body = s3.get_object(Bucket=bucket, Key=key, VersionId=version['VersionId'])['Body']
+    return codecs.getreader('utf-8')(body)
+
+
+def compare_syllabus(bucket,key,now_version,old_version,school):
+    #index every old course by the hashes of its fields, instead of keeping the whole old syllabus
+    with open_version(bucket,key,old_version) as old_file:
+        old_dict = {course["a"]: hash_fields(course) for course in iter_json_array(old_file)}
+    old_count = len(old_dict)
+
+    report = ChangeReport()
+    #ids already written, a batch with the same key twice is rejected as a whole
+    seen = set()
+    #compare old and new syllabus, only the changed fields of modified courses are written
+    with BatchWriter(table) as writer, open_version(bucket,key,now_version) as now_file:
+        for new_item in iter_json_array(now_file):
+            new_cs = Course(new_item)
+            match_id = new_cs.id
+            if match_id in seen:
+                logging.warning(f"Skip duplicate course {match_id} of {school}")
+                continue
+            seen.add(match_id)
+            old_hashes = old_dict.pop(match_id, None)
+            if old_hashes is None:
+                writer.put(create_db_item(new_cs,school))
+                report.add()
+                continue
+            fields = diff_course(old_hashes, new_cs)
+            if fields:
+                values = {**get_db_values(new_cs,fields), **get_index_values(new_cs.data,school,fields)}
+                writer.update(get_db_key(match_id,school), values)
+                report.modify(fields)
+        #courses left in old_dict are no longer in the syllabus
+        if len(old_dict) > max_removed_ratio * old_count:
+            logging.error(f"Skip deleting {len(old_dict)} of {old_count} courses of {school}")
         else:
-            insert_course(new_cs,table,school)
+            for removed_id in old_dict:
+                writer.delete(get_db_key(removed_id,school))
+                report.remove()
+
+    print(json.dumps({"school": school, **report.summary()}))
+    return report
             
 
+def backfill_syllabus(bucket,key,school):
+    """
+    Put every course of the latest version again, e.g. to write attributes added to the items.
+    """
+    versions = get_latest_versions(bucket,key,n=1)
+    if not versions:
+        return
+    seen = set()
+    with BatchWriter(table) as writer, open_version(bucket,key,versions[0]) as now_file:
+        for new_item in iter_json_array(now_file):
+            new_cs = Course(new_item)
+            if new_cs.id not in seen:
+                seen.add(new_cs.id)
+                writer.put(create_db_item(new_cs,school))
+
 def handler(event,context):
     
-    for record in event['Records']:
+    #invoked directly with {"backfill": [school]}
+    for school in event.get('backfill', []):
+        backfill_syllabus(os.getenv('BUCKET_NAME'),os.getenv('OBJECT_PATH') + school + '.json',school)
+    
+    for record in event.get('Records', []):
         bucket = record['s3']['bucket']['name'] #get bucket name
         key = record['s3']['object']['key'] #get key
         school = key[9:]
         school = school[0:school.find('.')]
+        # skip artifacts stored under sub paths, e.g. syllabus/fingerprint/<school>.json
+        if '/' in school:
+            continue
         
-        #get past versions
-        versions = s3r.Bucket(bucket).object_versions.filter(Prefix=key)
-        cnt = 0
-        now_version_obj = None
-        old_version_obj = None
-        now_name = ""
-        old_name = ""
-        os.makedirs('/tmp/', exist_ok=True)
-        
-        for version in versions:
-            cnt = cnt + 1
-            if cnt == 1:
-                now_version_obj = version.get()
-                #set name for json file downloaded
-                now_name = '/tmp/' + now_version_obj.get("LastModified").strftime("%Y%m%d%H%M%S") +'.json'
-                # Get old version json and new version json
-                transfesr.download_file(bucket,key,now_name,extra_args={'VersionId': now_version_obj['VersionId'] })
-            elif cnt == 2:
-                old_version_obj = version.get()
-                old_name = '/tmp/' + old_version_obj.get("LastModified").strftime("%Y%m%d%H%M%S") +'.json'
-                transfesr.download_file(bucket,key,old_name,  extra_args={'VersionId': old_version_obj['VersionId'] })
-            else:
-                break
-        
-        if cnt >= 2:
-            compare_syllabus(now_name,old_name,school)
-
+        #compare the two latest versions, unless the content is unchanged
+        versions = get_latest_versions(bucket,key)
+        if len(versions) < 2:
+            continue
+        now_version, old_version = versions
+        if now_version['ETag'] == old_version['ETag']:
+            print(f"{key} is unchanged")
+            continue
+        compare_syllabus(bucket,key,now_version,old_version,school)
@@ -1,5 +1,17 @@
+from botocore.exceptions import ClientError
+from concurrent.futures.thread import ThreadPoolExecutor
 from const import *
+from syllabus import s3_to_dynamo
+import hashlib
+import json
 import logging
+import random
+import re
+import time
+
+# fields compared between versions, the id is the key of the comparison
+diff_keys = [key for key in s3_to_dynamo if key != "a"]
+separator_pattern = re.compile(r'[\s,]*')
 
 class Course:
     def __init__(self,data):
@@ -24,58 +36,234 @@ def create_db_item(new_course,school):
         s3_to_dynamo["n"] : new_course.data["n"],
         s3_to_dynamo["o"] : new_course.data["o"],
         s3_to_dynamo["p"] : new_course.data["p"],
-        "school" : school
+        "school" : school,
+        **get_index_values(new_course.data,school)
     }
     return item
 
-def update_course(new_course,table,school):
-    #test
-    logging.info("update course " + new_course.data['a'])
-    try:
-        response = table.update_item(
-                Key={
-                    'id' : new_course.data["a"],
-                    'school':school
-                },
-                UpdateExpression="SET title=:b, title_jp=:c, instructor=:d, instructor_jp=:e, \
-                lang=:f, #tp=:g, term=:h, occurrences=:i, min_year=:j, category=:k, credit=:l, \
-                #lv=:m, #ev=:n, #cd=:o, subtitle=:p",
-                ExpressionAttributeNames = {
-                    '#tp': 'type',
-                    '#cd': 'code',
-                    '#lv': 'level',
-                    '#ev': 'eval'
-                },
-                ExpressionAttributeValues = {
-                    ':b': new_course.data['b'],
-                    ':c': new_course.data['c'],
-                    ':d': new_course.data['d'],
-                    ':e': new_course.data['e'],
-                    ':f': new_course.data['f'],
-                    ':g': new_course.data['g'],
-                    ':h': new_course.data['h'],
-                    ':i': new_course.data['i'],
-                    ':j': new_course.data['j'],
-                    ':k': new_course.data['k'],
-                    ':l': new_course.data['l'],
-                    ':m': new_course.data['m'],
-                    ':n': new_course.data['n'],
-                    ':o': new_course.data['o'],
-                    ':p': new_course.data['p'],
-                },
-                ReturnValues="UPDATED_NEW"
+def get_db_key(course_id,school):
+    return {'school': school, 'id': course_id}
+
+def get_index_values(data,school,fields=diff_keys):
+    """
+    Attributes derived for the syllabus filter: the composite key of SchoolTermIndex, e.g. "SILS#2s",
+    and the day/period keys of every occurrence matched with contains(), e.g. ["1#2", "1#", "#2"].
+    A GSI key holds one value, so occurrences are not indexed, a course can meet more than once a week.
+    :param data: compact dict of a course
+    :param school: abbr of the department. e.g. "PSE"
+    :param fields: compact keys that changed, only the attributes derived from them are returned
+    :return: dict := {attribute_name: value}
+    """
+    values = {}
+    if "h" in fields:
+        values["school_term"] = index_separator.join([school, data.get("h") or ""])
+    if "i" in fields:
+        occurrences = data.get("i")
+        keys = set()
+        for occurrence in (occurrences if isinstance(occurrences, list) else []):
+            day, period = str(occurrence.get("d", "")), str(occurrence.get("p", ""))
+            keys.update([index_separator.join([day, period]), day + index_separator, index_separator + period])
+        #a list and not a set, as sets can not be empty
+        values["day_periods"] = sorted(keys)
+    return values
+
+def hash_fields(data):
+    """
+    Hash each field of a course saved in the database
+    :param data: compact dict of a course
+    :return: bytes, the digests of the fields in the order of diff_keys concatenated
+    """
+    return b"".join(
+        hashlib.blake2b(json.dumps(data.get(key), sort_keys=True).encode('utf8'), digest_size=digest_size).digest()
+        for key in diff_keys
+    )
+
+def diff_course(old_hashes,new_course):
+    """
+    Get the fields saved in the database that differ between two versions of a course
+    :param old_hashes: hash_fields of the old version
+    :param new_course: Course
+    :return: list of compact keys, e.g. ["i", "p"]
+    """
+    new_hashes = hash_fields(new_course.data)
+    if new_hashes == old_hashes:
+        return []
+    return [key for i, key in enumerate(diff_keys)
+            if old_hashes[i * digest_size:(i + 1) * digest_size] != new_hashes[i * digest_size:(i + 1) * digest_size]]
+
+def iter_json_array(file,chunk_size=read_chunk_size):
+    """
+    Iterate the objects of a json array without loading the whole document
+    :param file: text file object
+    :param chunk_size: num of chars read at a time
+    :return: generator of the elements
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while not buffer:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a json array")
+    pos = 1
+    while True:
+        pos = separator_pattern.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the element is cut at the end of the buffer
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+
+def get_db_values(course,fields):
+    """
+    :param course: Course
+    :param fields: list of compact keys
+    :return: dict := {attribute_name: value}
+    """
+    return {s3_to_dynamo[key]: course.data.get(key) for key in fields}
+
+class ChangeReport:
+    """
+    Count of added, removed and modified courses of a run, and of the modified courses by field
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.removed = 0
+        self.modified = 0
+        self.fields = {}
+
+    def add(self):
+        self.added += 1
+
+    def remove(self):
+        self.removed += 1
+
+    def modify(self,fields):
+        self.modified += 1
+        for key in fields:
+            name = s3_to_dynamo[key]
+            self.fields[name] = self.fields.get(name, 0) + 1
+
+    def summary(self):
+        return {"added": self.added, "removed": self.removed, "modified": self.modified, "fields": self.fields}
+
+def get_request_ids(requests):
+    """
+    :param requests: list of PutRequest and DeleteRequest of BatchWriteItem
+    :return: list of the course ids
+    """
+    return [request['PutRequest']['Item']['id'] if 'PutRequest' in request else request['DeleteRequest']['Key']['id']
+            for request in requests]
+
+
+class BatchWriter:
+    """
+    Buffer put and delete requests of a table and write them with BatchWriteItem on a small thread pool.
+    Unprocessed items are retried with exponential backoff when the table throttles them.
+    A batch must not contain the same key twice, or the whole batch is rejected.
+    Writes still failing are raised when the writer is closed: the next run diffs against the version written now,
+    so they would never be retried otherwise. The failed invocation is retried by lambda instead.
+    """
+
+    def __init__(self, table, worker=write_worker):
+        """
+        :param table: dynamodb Table resource
+        :param worker: num of batches written concurrently
+        """
+        self.table = table
+        self.requests = []
+        self.executor = ThreadPoolExecutor(max_workers=worker)
+        self.futures = []
+        # ids of the courses not written
+        self.failed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        for future in self.futures:
+            future.result()
+        self.executor.shutdown()
+        if self.failed and exc_type is None:
+            raise RuntimeError(f"Fail write {len(self.failed)} courses: {self.failed}")
+
+    def update(self, key, values):
+        """
+        Set only the given attributes of an item, UpdateItem can not be batched so it is sent on the pool directly
+        :param key: primary key of the item
+        :param values: dict := {attribute_name: value}
+        :return: None
+        """
+        self.futures.append(self.executor.submit(self.update_item, key, values))
+
+    def update_item(self, key, values):
+        # placeholders for every attribute, since names like type and code are reserved words
+        expressions, names, placeholders = [], {}, {}
+        for i, (name, value) in enumerate(values.items()):
+            expressions.append(f"#f{i}=:v{i}")
+            names[f"#f{i}"] = name
+            placeholders[f":v{i}"] = value
+        try:
+            self.table.update_item(
+                Key=key,
+                UpdateExpression="SET " + ", ".join(expressions),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=placeholders,
             )
-    except Exception as e:
-        logging.error("Fail update course " + new_course.data['a'])
-        logging.error(e)
-    
-
-def insert_course(new_course,table,school):
-    #test
-    logging.info("Insert course:" + new_course.data['a'])
-    try:
-        response = table.put_item(Item=create_db_item(new_course,school))
-    except Exception as e:
-        logging.error("Fail insert course:" + new_course.data['a'])
-        logging.error(e)
-    return response
+        except ClientError as e:
+            logging.error(f"Fail update course {key['id']}")
+            logging.error(e)
+            self.failed.append(key['id'])
+
+    def put(self, item):
+        self.add({'PutRequest': {'Item': item}})
+
+    def delete(self, key):
+        self.add({'DeleteRequest': {'Key': key}})
+
+    def add(self, request):
+        self.requests.append(request)
+        if len(self.requests) >= batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.requests:
+            self.futures.append(self.executor.submit(self.write, self.requests))
+            self.requests = []
+
+    def write(self, requests):
+        """
+        Write a batch, retrying its unprocessed items
+        :param requests: list of at most batch_size requests
+        :return: None
+        """
+        client = self.table.meta.client
+        pending = {self.table.name: requests}
+        for retry in range(max_retries + 1):
+            if retry:
+                time.sleep(min(backoff_cap, backoff_base * 2 ** retry) * random.uniform(0.5, 1))
+            try:
+                pending = client.batch_write_item(RequestItems=pending).get('UnprocessedItems')
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ProvisionedThroughputExceededException':
+                    logging.error(f"Fail write batch of courses {get_request_ids(pending[self.table.name])}")
+                    logging.error(e)
+                    self.failed.extend(get_request_ids(pending[self.table.name]))
+                    return
+            if not pending:
+                return
+        logging.error(f"Fail write courses {get_request_ids(pending[self.table.name])} after {max_retries} retries")
+        self.failed.extend(get_request_ids(pending[self.table.name]))
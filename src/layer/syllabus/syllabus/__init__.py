@@ -0,0 +1,23 @@
+from .columnar import ColumnarEncoder, decode_columns, decode_courses
+from .parser import (
+    get_eval_criteria,
+    get_syllabus_texts,
+    index_course,
+    index_info_table,
+    merge_period_location,
+    parse_catalog,
+    parse_course,
+    parse_credit,
+    parse_lang,
+    parse_location,
+    parse_max_page,
+    parse_min_year,
+    parse_period,
+    parse_term,
+    scrape_info,
+    scrape_text,
+    to_enum,
+    to_half_width,
+)
+from .record import CourseRecord, compact_keys, s3_to_dynamo
+from .search import SearchIndexBuilder, search, tokenize
@@ -0,0 +1,161 @@
+from .record import compact_keys
+
+# bump whenever the layout changes
+columnar_version = 1
+
+# how each field of a course is stored:
+#   plain: the values as they are
+#   dict: distinct values once, and the index of the value of every course
+#   list: values of all courses flattened, with the offset of every course
+#   records: objects of all courses flattened into sub columns, with the offset of every course
+columnar_schema = {
+    "a": "plain",
+    "b": "plain",
+    "c": "plain",
+    "d": "dict",
+    "e": "dict",
+    "f": "list",
+    "g": "dict",
+    "h": "dict",
+    "i": ("records", {"d": "dict", "p": "dict", "l": "dict"}),
+    "j": "dict",
+    "k": "dict",
+    "l": "dict",
+    "m": "dict",
+    "n": ("records", {"t": "dict", "p": "dict", "c": "plain"}),
+    "o": "plain",
+    "p": "dict",
+    "q": "dict",
+    "r": "dict",
+}
+
+
+class ColumnEncoder:
+    """
+    Encoder of a single column, see columnar_schema
+    """
+
+    def __init__(self, kind):
+        if isinstance(kind, tuple):
+            kind, fields = kind
+            self.fields = {key: ColumnEncoder(sub_kind) for key, sub_kind in fields.items()}
+        self.kind = kind
+        self.values = []
+        self.index = {}
+        self.offsets = [0]
+        # values not matching the kind of the column, type: {row: value}
+        self.exceptions = {}
+
+    def add(self, value):
+        if self.kind == "plain":
+            self.values.append(value)
+        elif self.kind == "dict":
+            self.values.append(self.index.setdefault(value, len(self.index)))
+        elif not isinstance(value, list):
+            self.exceptions[str(len(self.offsets) - 1)] = value
+            self.offsets.append(self.offsets[-1])
+        elif self.kind == "list":
+            self.values += value
+            self.offsets.append(len(self.values))
+        else:
+            for record in value:
+                for key, column in self.fields.items():
+                    column.add(record.get(key))
+            self.offsets.append(self.offsets[-1] + len(value))
+
+    def to_json(self):
+        if self.kind == "plain":
+            return self.values
+        if self.kind == "dict":
+            return {"d": list(self.index), "x": self.values}
+        column = {"o": self.offsets, "x": self.exceptions}
+        if self.kind == "list":
+            column["v"] = self.values
+        else:
+            column["c"] = {key: sub_column.to_json() for key, sub_column in self.fields.items()}
+        return column
+
+
+class ColumnarEncoder:
+    """
+    Encode courses into columns, so repeated keys and values are stored once.
+    The result is a dict := {
+        "v": columnar_version,
+        "n": num of courses,
+        "c": {compact key: column}
+    }
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.columns = {key: ColumnEncoder(columnar_schema[key]) for key in compact_keys}
+
+    def add(self, course):
+        """
+        :param course: compact dict of a course
+        :return: None
+        """
+        self.count += 1
+        for key, column in self.columns.items():
+            column.add(course.get(key))
+
+    def collect(self, courses):
+        """
+        Encode the courses while passing them through
+        :param courses: iterator of compact dicts
+        :return: generator of the same courses
+        """
+        for course in courses:
+            self.add(course)
+            yield course
+
+    def to_json(self):
+        return {"v": columnar_version, "n": self.count,
+                "c": {key: column.to_json() for key, column in self.columns.items()}}
+
+
+def decode_column(column, kind, count):
+    """
+    :param column: encoded column
+    :param kind: kind of the column, see columnar_schema
+    :param count: num of rows
+    :return: list of values
+    """
+    if isinstance(kind, tuple):
+        kind, fields = kind
+    if kind == "plain":
+        return column
+    if kind == "dict":
+        distinct = column["d"]
+        return [distinct[i] for i in column["x"]]
+    offsets, exceptions = column["o"], column["x"]
+    if kind == "list":
+        values = column["v"]
+        return [exceptions[str(row)] if str(row) in exceptions else values[offsets[row]:offsets[row + 1]]
+                for row in range(count)]
+    size = offsets[-1]
+    sub_columns = {key: decode_column(column["c"][key], sub_kind, size) for key, sub_kind in fields.items()}
+    records = [{key: values[i] for key, values in sub_columns.items() if values[i] is not None} for i in range(size)]
+    return [exceptions[str(row)] if str(row) in exceptions else records[offsets[row]:offsets[row + 1]]
+            for row in range(count)]
+
+
+def decode_columns(data, keys=compact_keys):
+    """
+    Decode some columns of a columnar syllabus, without building the courses
+    :param data: columnar syllabus, see ColumnarEncoder
+    :param keys: compact keys of the columns to decode
+    :return: dict := {compact key: list of values}
+    """
+    if data["v"] != columnar_version:
+        raise ValueError(f"Unsupported columnar version {data['v']}")
+    return {key: decode_column(data["c"][key], columnar_schema[key], data["n"]) for key in keys}
+
+
+def decode_courses(data):
+    """
+    :param data: columnar syllabus, see ColumnarEncoder
+    :return: list of compact dicts, in the order they were encoded
+    """
+    columns = decode_columns(data)
+    return [{key: columns[key][row] for key in compact_keys} for row in range(data["n"])]
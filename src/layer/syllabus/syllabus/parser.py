@@ -0,0 +1,410 @@
+import copy
+import itertools
+import logging
+import re
+import unicodedata
+from lxml import etree, html
+
+from .const import *
+from .record import CourseRecord
+
+# xpath and regex are compiled once per container rather than on every lookup
+compiled_query = {key: etree.XPath(path) for key, path in query.items()}
+legacy_fields = {key[:-len("_old")]: key for key in info_fields if key.endswith("_old")}
+eval_rows_query = etree.XPath('table//tr')
+course_id_pattern = re.compile(r"\w{28}")
+format_chars_pattern = re.compile(r'[\n\r\t]')
+location_pattern = re.compile(r"^[\d]+-[\dA-Z-]+$")
+numbered_location_pattern = re.compile(r'0(\d):(.*)')
+occurrence_pattern = re.compile(r'(Mon|Tues|Wed|Thur|Fri|Sat|Sun)\.(\d-\d|\d|On demand)')
+
+
+def index_info_table(info):
+    """
+    Walk the info table of a course detail page once and index its cells by position
+    :param info: parsed info table
+    :return: dict := {(row, column): cell}, counted from 1 as in xpath
+    """
+    cells = {}
+    rows = (tr for tr in info if tr.tag == 'tr')
+    for i, row in enumerate(rows, 1):
+        for j, cell in enumerate((td for td in row if td.tag == 'td'), 1):
+            cells[(i, j)] = cell
+    return cells
+
+
+def first_text(element):
+    """
+    Get the first text node directly under element, same as 'text()[1]' in xpath
+    :param element: html element
+    :return: string or None
+    """
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+def scrape_info(cells, key, fn, legacy=False):
+    """
+    Extract info from the indexed info table and let it processed by fn
+    :param cells: info table indexed by index_info_table
+    :param key: category of info
+    :param fn: function used to transform data
+    :param legacy: the page has no modality row, so code, level and type are read from their old positions
+    :return: scraped information
+    """
+    if legacy:
+        key = legacy_fields.get(key, key)
+    row, column, *wrapper = info_fields[key]
+    cell = cells.get((row, column))
+    if cell is not None and wrapper:
+        cell = cell.find(wrapper[0])
+    text = first_text(cell) if cell is not None else None
+    if text is None:
+        return ""
+    if not fn:
+        return text
+    return fn(text)
+
+
+def parse_max_page(body):
+    """
+    Get the max page number from the first course catalog page
+    :param body: raw html
+    :return: int
+    """
+    try:
+        last = compiled_query["page_num"](html.fromstring(body))[-1]
+    except IndexError:
+        return 1
+    return int(last)
+
+
+def parse_catalog(body):
+    """
+    Get all the course id listed in a course catalog page
+    :param body: raw html
+    :return: list of course ids
+    """
+    clist = compiled_query["course_list"](html.fromstring(body))
+    return [course_id_pattern.search(compiled_query["course_id"](clist[i])[0]).group(0) for i in range(1, len(clist))]
+
+
+def index_course(body_en, body_jp=None):
+    """
+    Parse the EN and JP detail pages of a course and index the tables read by parse_course
+    :param body_en: raw html of the english page
+    :param body_jp: raw html of the japanese page, the JP fields are left empty if it is None
+    :return: (info_en, info_jp, texts_en)
+    """
+    parsed_en = html.fromstring(body_en)
+    info_en = index_info_table(compiled_query["info_table"](parsed_en)[0])
+    info_jp = {}
+    if body_jp is not None:
+        info_jp = index_info_table(compiled_query["info_table"](html.fromstring(body_jp))[0])
+    return info_en, info_jp, get_syllabus_texts(parsed_en)
+
+
+def parse_course(course_id, info_en, info_jp, texts_en, flatten=True):
+    """
+    Parse the detail of a course from its indexed pages, see index_course
+    :param course_id:
+    :param info_en: indexed info table of the english page
+    :param info_jp: indexed info table of the japanese page
+    :param texts_en: indexed syllabus texts of the english page
+    :param flatten: replace line breaks in the evaluation criteria with spaces
+    :return: CourseRecord
+    """
+    # pages without modality keep code, level and type in the old layout
+    modality = scrape_info(info_jp, 'modality', to_enum(modality_enum_map))
+    legacy = modality == -1
+    locations = scrape_info(info_en, 'classroom', parse_location)
+    periods = scrape_info(info_en, 'occurrence', parse_period)
+    return CourseRecord(
+        id=course_id,
+        title=scrape_info(info_en, 'title', to_half_width),
+        title_jp=scrape_info(info_jp, 'title', to_half_width),
+        instructor=scrape_info(info_en, 'instructor', to_half_width),
+        instructor_jp=scrape_info(info_jp, 'instructor', to_half_width),
+        lang=scrape_info(info_en, 'lang', parse_lang),
+        type=scrape_info(info_jp, 'type', to_enum(type_enum_map), legacy),
+        term=scrape_info(info_en, 'occurrence', parse_term),
+        occurrences=merge_period_location(periods, locations),
+        min_year=scrape_info(info_en, 'min_year', parse_min_year),
+        category=scrape_info(info_en, 'category', to_half_width),
+        credit=scrape_info(info_en, 'credit', parse_credit),
+        level=scrape_info(info_jp, 'level', to_enum(level_enum_map), legacy),
+        eval=get_eval_criteria(texts_en, flatten),
+        code=scrape_info(info_jp, 'code', None, legacy),
+        subtitle=scrape_text(texts_en, "Subtitle", to_half_width),
+        category_jp=scrape_info(info_jp, 'category', to_half_width),
+        modality=modality,
+    )
+
+
+def to_half_width(s):
+    """
+    Converts zenkaku to hankaku
+    :param s:
+    :return:
+    """
+    if not s:
+        return ""
+    return unicodedata.normalize('NFKC', s)
+
+
+def remove_format_chars(line):
+    cleaned_line = format_chars_pattern.sub(' ', line)
+    return cleaned_line
+
+
+def get_eval_criteria(texts, flatten=True):
+    """
+    Get the evaluation criteria from course detail page
+    :param texts: syllabus texts indexed by get_syllabus_texts
+    :param flatten: replace line breaks in the criteria with spaces
+    :return: array :=
+        [{
+            "t": 'enum' # type
+            "p": 'int' # percent
+            "c": 'string' #criteria
+        }]
+    """
+    table = texts.get("Evaluation")
+    if table is None:
+        return []
+    evals = []
+    rows = eval_rows_query(table)
+    # Case 1: the only row is the table header
+    if len(rows) < 2:
+        return []
+    # Case 2: 2 or more rows
+    for r in rows[1:]:
+        elem = r.getchildren()
+        kind = elem[0].text_content().strip()
+        percent = elem[1].text.strip()[:-1] or -1
+        try:
+            percent = int(percent)
+        except ValueError:
+            logging.warning(f"Unable to parse percent: {percent}")
+        criteria = to_half_width(elem[2].text_content())
+        if flatten:
+            criteria = remove_format_chars(criteria)
+        evals.append({
+            "t": to_enum(eval_type_map)(kind),
+            "p": percent,
+            "c": criteria
+        })
+    return evals
+
+
+def scrape_text(texts, row_name, fn, full=False):
+    """
+    Extract a row of the syllabus texts and let it processed by fn
+    :param texts: syllabus texts indexed by get_syllabus_texts
+    :param row_name: name of the row
+    :param fn: function used to transform data
+    :param full: read the whole content with <br> as line breaks, instead of only the first line
+    :return: scraped text
+    """
+    element = texts.get(row_name)
+    if element is None:
+        return ""
+    if not full:
+        return fn(element.text)
+    # work on a copy so the parsed page is left untouched
+    element = copy.deepcopy(element)
+    for br in element.iter('br'):
+        br.tail = "\n" + br.tail if br.tail else "\n"
+    return fn(element.text_content())
+
+
+def get_syllabus_texts(course_html):
+    """
+    Get all the "Syllabus Information" in course details page, walking the table once
+    :param course_html: parsed html
+    :return: dict:=
+        {
+            row1_name: row1_content,
+            ...
+        }
+        where the content is an Element or None if the row is empty, the first row wins on duplicated names
+    """
+    texts = {}
+    if course_html is None:
+        return texts
+    for row in compiled_query["text_table"](course_html):
+        header = row.find('th')
+        row_name = first_text(header) if header is not None else None
+        texts.setdefault(row_name or "", row.find('td'))
+    return texts
+
+
+def merge_period_location(periods, locations):
+    """
+    Join location with period
+    :param periods: list
+    :param locations: list
+    :return: array of dict
+    """
+    occurrences = []
+    # Case 1: multiple periods but only one location
+    if len(locations) == 1:
+        for p in periods:
+            p["l"] = locations[0]
+        return periods
+    # Case 2: More no. of periods than no. of locations
+    zipped = list(itertools.zip_longest(periods, locations))
+    for (p, loc) in zipped:
+        if p is None:
+            logging.error(f"Unexpected None in periods. loc={loc}")
+            continue
+
+        if loc is not None:
+            p["l"] = loc
+        else:
+            logging.warning(
+                f"Missing location for period {p}. Assigning default value.")
+            p["l"] = "undecided"
+
+        occurrences.append(p)
+
+    # Case 3: Logging error for unusual scenarios
+    if not occurrences:
+        logging.error(
+            f"merge_period_location resulted in no occurrences for input periods={periods}, locations={locations}")
+
+    return occurrences
+
+
+def parse_min_year(eligible_year):
+    """
+    Parse minimum eligible year
+    :param eligible_year: string
+    :return: int
+    """
+    if not eligible_year:
+        return -1
+    if eligible_year[0].isdigit():
+        return int(eligible_year[0])
+    return -1
+
+
+def rename_location(loc):
+    if location_pattern.fullmatch(loc):
+        return loc
+    elif loc in location_name_map.keys():
+        return location_name_map[loc]
+    else:
+        logging.warning(f"Unable to parse location: {loc}")
+        return to_half_width(loc)
+
+
+def parse_location(loc):
+    """
+    Parse a series of locations
+    :param loc: string
+    :return: list
+    """
+    # Case 1: no location
+    if loc.isspace():
+        return ["undecided"]
+    # Case 2: a single location
+    if len(loc.split('／')) == 1:
+        return [rename_location(loc)]
+    # Case 3: multiple 'period:location' separated by /
+    rooms = []
+    locations = loc.split('／')
+    for l in locations:
+        matches = numbered_location_pattern.findall(l)
+        for match in matches:
+            count, classroom = int(match[0]) - 1, match[1]
+            classroom = rename_location(classroom)
+            if count >= len(rooms):
+                rooms.append([classroom])
+            else:
+                rooms[count].append(classroom)
+    return [room for sublist in rooms for room in sublist]
+
+
+def parse_lang(lang):
+    if lang == "N/A":
+        return [-1]
+    langs = lang.split('/')
+    lang_list = [to_enum(lang_enum_map)(l) for l in langs]
+    return lang_list
+
+
+def parse_term(schedule):
+    """
+    Parse the term from string 'term  day/period'
+    :param schedule: string
+    :return: string(encoded_term)
+    """
+    try:
+        (term, _) = schedule.split(u'\xa0\xa0', 1)
+    except ValueError:
+        logging.warning(f"Unable to parse term from '{schedule}'")
+        return "undecided"
+    if term not in term_enum_map.keys():
+        logging.error(f"Unknown term '{term}'")
+        return ""
+    return to_enum(term_enum_map)(term)
+
+
+def parse_period(schedule):
+    """
+    Extract day and period from raw data
+    :param schedule: string
+    :return: term and occurrence(list)
+    """
+    # TODO optimize code structure
+    try:
+        (_, occ) = schedule.split(u'\xa0\xa0', 1)
+    except ValueError:
+        logging.warning(f"Unable to parse period: {schedule}")
+        return []
+    if occ == "othersothers":
+        return [{"d": -1, "p": -1}]
+    if occ == "othersOn demand":
+        return [{"d": -1, "p": 0}]
+    occ_matches = occurrence_pattern.finditer(occ)
+    occurrences = []
+    for match in occ_matches:
+        day, period = match.group(1), match.group(2)
+        day = to_enum(weekday_enum_map)(day)
+        if period is None:
+            period = -1
+        elif period == "On demand":
+            period = 0
+        elif period.isdigit():
+            period = int(period)
+        else:
+            p1, p2 = period.split('-', 1)
+            period = int(p1) * 10 + int(p2)
+        occurrences.append({"d": day, "p": period})
+    return occurrences
+
+
+def parse_credit(credit):
+    if credit.isdigit():
+        return int(credit)
+    return -1
+
+
+def to_enum(enum_map):
+    def map_to_int(data):
+        if not data:
+            return -1
+        if data == u'\xa0':
+            return -1
+        try:
+            return enum_map[data]
+        except KeyError:
+            logging.warning(f"Unable to map '{data}' to integer")
+            return -1
+
+    return map_to_int
@@ -0,0 +1,32 @@
+from collections import namedtuple
+
+# keys of a course in the syllabus json, in the order of the fields of CourseRecord
+compact_keys = ("a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p", "q", "r")
+
+
+class CourseRecord(namedtuple("CourseRecord", [
+    "id", "title", "title_jp", "instructor", "instructor_jp", "lang", "type", "term", "occurrences", "min_year",
+    "category", "credit", "level", "eval", "code", "subtitle", "category_jp", "modality"
+])):
+    """
+    Course parsed from its detail pages, saved as a compact dict keyed by compact_keys in the syllabus json
+    """
+    __slots__ = ()
+
+    def to_compact(self):
+        """
+        :return: dict := {"a": id, "b": title, ...}
+        """
+        return dict(zip(compact_keys, self))
+
+    @classmethod
+    def from_compact(cls, data):
+        """
+        :param data: compact dict of a course, missing keys default to ""
+        :return: CourseRecord
+        """
+        return cls(*(data.get(key, "") for key in compact_keys))
+
+
+# category_jp and modality are not saved in the database
+s3_to_dynamo = dict(zip(compact_keys[:16], CourseRecord._fields[:16]))
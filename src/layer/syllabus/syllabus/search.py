@@ -0,0 +1,167 @@
+import re
+import unicodedata
+
+from .columnar import decode_columns
+
+# bump whenever the layout changes
+search_index_version = 2
+
+# filterable fields and the compact key they are read from
+search_fields = {
+    "term": "h",
+    "lang": "f",
+    "level": "m",
+    "type": "g",
+    "credit": "l",
+    "min_year": "j",
+}
+
+# day and period of the same occurrence, so that "Mon 2" does not match a course on Mon 1 and Tue 2
+day_period_field = "day_period"
+day_period_separator = "#"
+
+# compact keys of the texts searched by tokens: title, title_jp, instructor, instructor_jp
+token_keys = ("b", "c", "d", "e")
+
+latin_token_pattern = re.compile(r"[a-z0-9]{2,}")
+cjk_run_pattern = re.compile(r"[^\x00-\x7f\s]+")
+
+
+def tokenize(text):
+    """
+    Split a text into search tokens.
+    Latin words are kept whole, other scripts are split into character bigrams as they have no spaces,
+    so that any part of a japanese title can be matched.
+    :param text: string
+    :return: set of tokens
+    """
+    if not isinstance(text, str):
+        return set()
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = set(latin_token_pattern.findall(text))
+    for run in cjk_run_pattern.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def encode_postings(docs):
+    """
+    :param docs: ascending doc numbers
+    :return: list of the gaps between doc numbers
+    """
+    return [doc - prev for prev, doc in zip([0] + docs, docs)]
+
+
+def decode_postings(gaps):
+    """
+    :param gaps: see encode_postings
+    :return: list of ascending doc numbers
+    """
+    docs = []
+    doc = 0
+    for gap in gaps:
+        doc += gap
+        docs.append(doc)
+    return docs
+
+
+def join_day_period(day, period):
+    return f"{day}{day_period_separator}{period}"
+
+
+class SearchIndexBuilder:
+    """
+    Inverted index of the courses of all schools, so that filtering across schools is an intersection of postings.
+    The result is a dict := {
+        "v": search_index_version,
+        "schools": [school],
+        "docs": {"s": [index of the school of every doc], "a": [course id of every doc]},
+        "postings": {field: {value: postings}},
+        "tokens": {token: postings}
+    }
+    Postings are the gaps between ascending doc numbers, see encode_postings.
+    """
+
+    def __init__(self):
+        self.schools = []
+        self.doc_schools = []
+        self.doc_ids = []
+        # type: {field: {value: [doc]}}
+        self.postings = {field: {} for field in list(search_fields) + ["school", "day", "period", day_period_field]}
+        # type: {token: [doc]}
+        self.tokens = {}
+
+    def post(self, field, value, doc):
+        docs = self.postings[field].setdefault(str(value), [])
+        # a course can have the same value more than once, e.g. the same day in two occurrences
+        if not docs or docs[-1] != doc:
+            docs.append(doc)
+
+    def add_school(self, school, columnar):
+        """
+        :param school: abbr of the department. e.g. "PSE"
+        :param columnar: columnar syllabus of the department, see ColumnarEncoder
+        :return: None
+        """
+        columns = decode_columns(columnar, ("a", "i") + tuple(search_fields.values()) + token_keys)
+        school_index = len(self.schools)
+        self.schools.append(school)
+        for row, course_id in enumerate(columns["a"]):
+            doc = len(self.doc_ids)
+            self.doc_ids.append(course_id)
+            self.doc_schools.append(school_index)
+            self.post("school", school, doc)
+            for field, key in search_fields.items():
+                value = columns[key][row]
+                for v in (value if isinstance(value, list) else [value]):
+                    self.post(field, v, doc)
+            occurrences = columns["i"][row]
+            for occurrence in (occurrences if isinstance(occurrences, list) else []):
+                self.post("day", occurrence.get("d"), doc)
+                self.post("period", occurrence.get("p"), doc)
+                self.post(day_period_field, join_day_period(occurrence.get("d"), occurrence.get("p")), doc)
+            for token in set().union(*(tokenize(columns[key][row]) for key in token_keys)):
+                self.tokens.setdefault(token, []).append(doc)
+
+    def to_json(self):
+        return {
+            "v": search_index_version,
+            "schools": self.schools,
+            "docs": {"s": self.doc_schools, "a": self.doc_ids},
+            "postings": {field: {value: encode_postings(docs) for value, docs in values.items()}
+                         for field, values in self.postings.items()},
+            "tokens": {token: encode_postings(docs) for token, docs in sorted(self.tokens.items())}
+        }
+
+
+def search(index, filters=None, text=None):
+    """
+    Search courses in a search index.
+    Values of the same field are OR-ed and different fields are AND-ed, same as the syllabus filter of the api.
+    Days and periods given together must match the same occurrence.
+    :param index: search index, see SearchIndexBuilder
+    :param filters: dict := {field: [value]}
+    :param text: words matched against the title and instructor
+    :return: list of (school, course id), in the order of the index
+    """
+    if index["v"] != search_index_version:
+        raise ValueError(f"Unsupported search index version {index['v']}")
+    filters = dict(filters or {})
+    if "day" in filters and "period" in filters:
+        days, periods = filters.pop("day"), filters.pop("period")
+        filters[day_period_field] = [join_day_period(d, p) for d in days for p in periods]
+    matches = []
+    for field, values in filters.items():
+        postings = index["postings"][field]
+        matches.append(set().union(*(decode_postings(postings.get(str(v), [])) for v in values)))
+    for token in tokenize(text):
+        matches.append(set(decode_postings(index["tokens"].get(token, []))))
+    docs = index["docs"]
+    if not matches:
+        hits = range(len(docs["a"]))
+    else:
+        matches.sort(key=len)
+        hits = sorted(set.intersection(*matches))
+    return [(index["schools"][docs["s"][doc]], docs["a"][doc]) for doc in hits]